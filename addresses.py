@@ -0,0 +1,201 @@
+"""
+Address model (Task 4): Country <- State <- Locality <- Address.
+
+Countries, states and localities are interned by an AddressRegistry so only
+one object exists per distinct value, e.g. a single Country for USA. Keys
+are composite, so two cities sharing a name in different states (or with
+different zip codes) stay distinct. All classes use __slots__ since millions
+of addresses may be held at once.
+
+iter_address_chunks streams addresses straight from the address columns of
+Customer / Invoice (optionally de-duplicated in SQL) without loading the
+mapped entities.
+"""
+from sqlalchemy import case, func, or_, select, union, union_all
+
+CHUNK_SIZE = 1000
+
+# address components in model order: street, city, zip_code, state, country
+CUSTOMER_ADDRESS_COLUMNS = ('Address', 'City', 'PostalCode', 'State', 'Country')
+INVOICE_ADDRESS_COLUMNS = ('BillingAddress', 'BillingCity', 'BillingPostalCode',
+                           'BillingState', 'BillingCountry')
+
+
+class Country(object):
+    """
+    name      -> Name of country
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Country(%r)' % (self.name,)
+
+
+class State(object):
+    """
+    name      -> Name of state
+    country   -> Country object
+    """
+    __slots__ = ('name', 'country')
+
+    def __init__(self, name, country):
+        self.name = name
+        self.country = country
+
+    def __repr__(self):
+        return 'State(%r, %r)' % (self.name, self.country)
+
+
+class Locality(object):
+    """
+    name      -> Name of locality
+    zip_code  -> Zip code
+    state     -> State object
+    """
+    __slots__ = ('name', 'zip_code', 'state')
+
+    def __init__(self, name, zip_code, state):
+        self.name = name
+        self.zip_code = zip_code
+        self.state = state
+
+    def __repr__(self):
+        return 'Locality(%r, %r, %r)' % (self.name, self.zip_code, self.state)
+
+
+class Address(object):
+    """
+    name      -> Street address
+    locality  -> Locality object
+    """
+    __slots__ = ('name', 'locality')
+
+    def __init__(self, name, locality):
+        self.name = name
+        self.locality = locality
+
+    def __repr__(self):
+        return 'Address(%r, %r)' % (self.name, self.locality)
+
+
+class AddressRegistry(object):
+    """
+    Interns Country, State and Locality objects.
+
+    Keys are built from the raw column values:
+      country   -> country
+      state     -> (state, country)
+      locality  -> (city, zip_code, state, country)
+    Missing (None) components are part of the key, so e.g. a missing state
+    in Brazil and one in Norway are two different State objects. Use one
+    registry per extraction (or clear() it) to release the interned objects.
+    """
+
+    def __init__(self):
+        self._countries = {}
+        self._states = {}
+        self._localities = {}
+
+    def __len__(self):
+        return len(self._countries) + len(self._states) + len(self._localities)
+
+    def clear(self):
+        self._countries.clear()
+        self._states.clear()
+        self._localities.clear()
+
+    def country(self, country):
+        obj = self._countries.get(country)
+        if obj is None:
+            obj = self._countries[country] = Country(country)
+        return obj
+
+    def state(self, state, country):
+        key = (state, country)
+        obj = self._states.get(key)
+        if obj is None:
+            obj = self._states[key] = State(state, self.country(country))
+        return obj
+
+    def locality(self, city, zip_code, state, country):
+        key = (city, zip_code, state, country)
+        obj = self._localities.get(key)
+        if obj is None:
+            obj = self._localities[key] = Locality(city, zip_code,
+                                                   self.state(state, country))
+        return obj
+
+    def address(self, street, city, zip_code, state, country):
+        return Address(street, self.locality(city, zip_code, state, country))
+
+    def bulk_addresses(self, rows):
+        """
+        Builds an Address for every (street, city, zip_code, state, country)
+        tuple in <rows> in a single pass and returns them as a list. Rows
+        sharing a locality only cost one dict lookup.
+        """
+        localities = self._localities
+        locality = self.locality
+        addresses = []
+        append = addresses.append
+        for street, city, zip_code, state, country in rows:
+            obj = localities.get((city, zip_code, state, country))
+            if obj is None:
+                obj = locality(city, zip_code, state, country)
+            append(Address(street, obj))
+        return addresses
+
+
+def is_blank(column):
+    """
+    Returns a condition that is true when the address component <column>
+    is missing: NULL or empty
+    """
+    return or_(column.is_(None), func.trim(column) == '')
+
+
+def missing_flag(mapped_class, columns):
+    """
+    Returns an expression that is 1 when any of the address <columns> of
+    <mapped_class> (or of a table's .c collection) is missing (see is_blank)
+    and 0 otherwise
+    """
+    cols = [getattr(mapped_class, c) for c in columns]
+    return case([(or_(*[is_blank(c) for c in cols]), 1)], else_=0)
+
+
+def address_select(mapped_class, columns):
+    """
+    Returns a select of the 5 address <columns> of <mapped_class> followed
+    by a 'missing' flag (see missing_flag)
+    """
+    cols = [getattr(mapped_class, c) for c in columns]
+    return select(cols + [missing_flag(mapped_class, columns).label('missing')])
+
+
+def iter_address_chunks(session, registry, selects, distinct=False,
+                        chunk_size=CHUNK_SIZE):
+    """
+    Yields (addresses, missing_addresses) lists of at most <chunk_size>
+    Address objects built from <selects> (see address_select). Several
+    selects are merged with UNION ALL, or UNION when <distinct> is True so
+    duplicated addresses are dropped by the database. Only one chunk of
+    rows is held at a time.
+    """
+    if len(selects) == 1:
+        query = selects[0].distinct() if distinct else selects[0]
+    else:
+        query = (union if distinct else union_all)(*selects)
+
+    result = session.execute(query)
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        # the 5 address components, the missing flag comes last
+        addresses = registry.bulk_addresses(row[:5] for row in rows)
+        missing_addresses = [addr for addr, row in zip(addresses, rows) if row[5]]
+        yield addresses, missing_addresses
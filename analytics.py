@@ -0,0 +1,80 @@
+"""
+Vectorized (pandas / NumPy) analytics backend for the sales reports.
+
+Instead of loading Albums -> Tracks -> InvoiceLines as ORM object graphs and
+adding Decimals one at a time, only the needed columns are fetched into
+columnar frames and aggregated with groupby / merge. Prices are summed as
+integer cents so the results are exact and match the SQL reports.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from money import cents, cents_to_decimal
+
+CHUNK_SIZE = 50000
+
+
+def read_frame(session, query, chunk_size=CHUNK_SIZE):
+    """
+    Executes <query> and returns its rows as a DataFrame, fetching
+    <chunk_size> rows at a time from the cursor
+    """
+    result = session.execute(query)
+    columns = list(result.keys())
+    frames = []
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        frames.append(pd.DataFrame.from_records(rows, columns=columns))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def album_sales_frame(session, metadata, by_quantity=False):
+    """
+    Returns a DataFrame (Title, cents) of the sales per album title, highest
+    first and ties by title. Like task_6_sql_version albums sharing a title are summed
+    together and every invoice line counts its UnitPrice once; set
+    <by_quantity> to weight each line by its Quantity.
+
+    <metadata> is the MetaData holding the reflected Album, Track and
+    InvoiceLine tables.
+    """
+    album = metadata.tables['Album']
+    track = metadata.tables['Track']
+    line = metadata.tables['InvoiceLine']
+
+    # integer cents computed by sqlite, skipping the per value Decimal conversion
+    lines = read_frame(session, select([line.c.TrackId,
+                                        cents(line.c.UnitPrice).label('cents'),
+                                        line.c.Quantity]))
+    tracks = read_frame(session, select([track.c.TrackId, track.c.AlbumId]))
+    albums = read_frame(session, select([album.c.AlbumId, album.c.Title]))
+
+    lines['cents'] = lines['cents'].astype(np.int64)
+    if by_quantity:
+        lines['cents'] *= lines['Quantity'].astype(np.int64)
+
+    # sum per track first, the join then only touches sold tracks once
+    per_track = lines.groupby('TrackId', sort=False)['cents'].sum()
+    per_album = tracks.merge(per_track, left_on='TrackId', right_index=True).\
+        groupby('AlbumId', sort=False)['cents'].sum()
+    per_title = albums.merge(per_album, left_on='AlbumId', right_index=True).\
+        groupby('Title', sort=False)['cents'].sum()
+
+    # equal sales are ranked by title, like the SQL & Python reports
+    return per_title.reset_index().sort_values(
+        ['cents', 'Title'], ascending=[False, True], kind='mergesort').\
+        reset_index(drop=True)
+
+
+def top_albums_by_sales(session, metadata, n=5, by_quantity=False):
+    """
+    Returns a list of the <n> best selling album titles as (title, Decimal)
+    """
+    frame = album_sales_frame(session, metadata, by_quantity=by_quantity)
+    return [(title, cents_to_decimal(cents))
+            for title, cents in frame.head(n).itertuples(index=False)]
@@ -0,0 +1,180 @@
+"""
+Asyncio front end for the reports of main.py.
+
+The reports are synchronous DB code, so they run on a bounded thread pool
+while the event loop stays free:
+
+    async with AsyncReportRunner('database.sqlite', workers=4) as runner:
+        counts, sales = await asyncio.gather(runner.album_counts(),
+                                             runner.album_sales(timeout=5))
+
+Every worker thread has its own session on a QueuePool of <workers> reader
+connections. pysqlite releases the GIL while SQLite executes, so reports
+overlap while they wait (on the disk, a lock, a slow function) and SQL
+heavy reports run in parallel only given spare CPU cores: on one core, or
+for the Chinook sized reports that mostly build Python rows under the GIL,
+more workers don't raise throughput and thread switching can lower it (see
+benchmarks/async_reports.py, whose --check shows the overlap). A report cancelled or timed out while it runs
+is stopped with sqlite3 Connection.interrupt(), which aborts the statement
+in progress, and its worker is freed for the next report. Interrupting
+between two statements is a no-op, so every statement of a worker is
+checked first and the next one of a cancelled report raises instead.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import main
+from engine_profile import create_profiled_engine
+
+WORKERS = 4
+
+
+class ReportCancelled(Exception):
+    """
+    Raised in the worker of a report cancelled before or between its
+    statements
+    """
+
+
+class _Job(object):
+    """
+    One report submitted to the pool, remembers the DBAPI connection it
+    runs on so it can be interrupted
+    """
+    __slots__ = ('connection', 'cancelled', 'lock')
+
+    def __init__(self):
+        self.connection = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def attach(self, connection):
+        with self.lock:
+            if self.cancelled:
+                raise ReportCancelled()
+            self.connection = connection
+
+    def detach(self):
+        with self.lock:
+            self.connection = None
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.connection is not None:
+                self.connection.interrupt()
+
+
+class AsyncReportRunner(object):
+    """
+    Runs the reports of main.REPORTS on a pool of <workers> threads, each
+    with its own session on the sqlite database located in <db_path>
+    (default main.dbPath). Connections are opened read-only with the engine
+    <profile>.
+    """
+
+    def __init__(self, db_path=None, workers=WORKERS, profile='report'):
+        db_path = db_path or main.dbPath
+        if main.Base is None:
+            # maps the classes the reports query, the shared session isn't used
+            main.setup(db_path).close()
+        self.workers = workers
+        self.engine = create_profiled_engine(db_path, profile, read_only=True,
+                                             pool_size=workers)
+        self.Session = sessionmaker(bind=self.engine)
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='report')
+        self._local = threading.local()
+        # submitted & not yet done, cancelled by close()
+        self._futures = set()
+        event.listen(self.engine, 'before_cursor_execute', self._check_cancelled)
+
+    def _check_cancelled(self, conn, cursor, statement, parameters, context,
+                         executemany):
+        job = getattr(self._local, 'job', None)
+        if job is not None and job.cancelled:
+            raise ReportCancelled()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self.Session()
+        return session
+
+    def _call(self, job, report, args):
+        session = self._session()
+        self._local.job = job
+        try:
+            # the DBAPI connection under the pool proxy, interrupted on cancel
+            job.attach(session.connection().connection.connection)
+            return report(session, *args)
+        finally:
+            job.detach()
+            self._local.job = None
+            # releases the connection to the pool & forgets loaded objects
+            session.close()
+
+    async def run(self, name, *args, timeout=None):
+        """
+        Returns the result of the report <name> (see main.REPORTS) called
+        with <args>. Raises asyncio.TimeoutError once <timeout> seconds
+        elapsed, the report is then interrupted like a cancelled one.
+        """
+        return await self.submit(main.REPORTS[name], *args, timeout=timeout)
+
+    async def submit(self, report, *args, timeout=None):
+        """
+        Returns the result of report(session, *<args>) run by a worker, see
+        run() for <timeout> & cancellation
+        """
+        job = _Job()
+        submitted = self.executor.submit(self._call, job, report, args)
+        self._futures.add(submitted)
+        submitted.add_done_callback(self._futures.discard)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(submitted), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            job.cancel()
+            raise
+
+    async def run_many(self, names, timeout=None, return_exceptions=False):
+        """
+        Returns the results of the reports <names>, run concurrently
+        """
+        return await asyncio.gather(*(self.run(name, timeout=timeout)
+                                      for name in names),
+                                    return_exceptions=return_exceptions)
+
+    async def album_counts(self, timeout=None):
+        return await self.run('task_3_sql', timeout=timeout)
+
+    async def album_sales(self, timeout=None):
+        return await self.run('task_6_sql', timeout=timeout)
+
+    async def artist_track_sales(self, timeout=None):
+        return await self.run('task_7_artist_top_tracks', timeout=timeout)
+
+    async def playlist_track_counts(self, timeout=None):
+        return await self.run('task_8_playlist_track_counts', timeout=timeout)
+
+    async def address_counts(self, timeout=None):
+        return await self.run('task_4_addresses', timeout=timeout)
+
+    def close(self):
+        # drops the reports still queued (shutdown's cancel_futures needs
+        # Python 3.9) and waits for the running ones
+        for future in list(self._futures):
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        self.engine.dispose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # waits for the workers without blocking the loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the report code in main.py, run from the repository root,
+e.g. python -m benchmarks.startup
+"""
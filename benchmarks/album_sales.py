@@ -0,0 +1,88 @@
+"""
+Album sales report: ORM object graph vs. pandas frames vs. SQL.
+
+Runs the per album sales aggregation of Task 6 on the same database with
+the ORM (prices mapped as Decimal and as integer cents, see money.py),
+pandas and SQL, checks that they agree and prints wall time and peak
+Python memory (tracemalloc) for each.
+
+usage: python -m benchmarks.album_sales [--db database.sqlite]
+"""
+import argparse
+import warnings
+from decimal import Decimal
+
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+
+import analytics
+from benchmarks.common import automap, measure, new_session
+
+SQL_QUERY = "select a.title, sum(cast(round(i.unitprice * 100) as integer)) " \
+            "from InvoiceLine i " \
+            "inner join Track t on t.trackid = i.trackid " \
+            "inner join Album a on a.albumid = t.albumid " \
+            "group by a.title"
+
+
+def orm_sales(engine, Base):
+    # the ORM object graph walk task_6_python_version used before plain rows,
+    # UnitPrice being either a Decimal or integer cents depending on <Base>
+    Albums, Tracks = Base.classes.Album, Base.classes.Track
+    session = new_session(engine)
+    albums = session.query(Albums).\
+        options(joinedload(Albums.track_collection).
+                joinedload(Tracks.invoiceline_collection)).all()
+    sales = {}
+    for album in albums:
+        total = sales.get(album.Title, 0)
+        for track in album.track_collection:
+            for item in track.invoiceline_collection:
+                total += item.UnitPrice
+        sales[album.Title] = total
+    session.close()
+    return {title: int(total * 100) if isinstance(total, Decimal) else total
+            for title, total in sales.items() if total}
+
+
+def pandas_sales(engine, Base):
+    session = new_session(engine)
+    frame = analytics.album_sales_frame(session, Base.metadata)
+    session.close()
+    return dict(zip(frame['Title'], (int(c) for c in frame['cents'])))
+
+
+def sql_sales(engine, Base):
+    session = new_session(engine)
+    sales = dict(session.execute(text(SQL_QUERY)).fetchall())
+    session.close()
+    return sales
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='database.sqlite')
+    args = parser.parse_args()
+
+    # the Decimal mapping warns about pysqlite lacking native Decimal
+    warnings.filterwarnings('ignore')
+    engine, Base = automap(args.db)
+    decimal_engine, DecimalBase = automap(args.db, money_columns=False)
+
+    results = []
+    for name, fn, mapped in (('orm_decimal', orm_sales, (decimal_engine, DecimalBase)),
+                             ('orm_cents', orm_sales, (engine, Base)),
+                             ('pandas', pandas_sales, (engine, Base)),
+                             ('sql', sql_sales, (engine, Base))):
+        sales, seconds, peak = measure(lambda: fn(*mapped))
+        results.append((name, sales, seconds, peak))
+
+    expected = results[-1][1]
+    print('%-12s %10s %12s %8s' % ('backend', 'seconds', 'peak MiB', 'match'))
+    for name, sales, seconds, peak in results:
+        print('%-12s %10.3f %12.2f %8s' % (name, seconds, peak / 2.0 ** 20,
+                                         sales == expected))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Throughput of AsyncReportRunner by number of reader connections.
+
+The same batch of reports (--reports, --rounds times) is gathered from one
+event loop by runners with 1, 2, 4 ... --max-workers threads / connections,
+and the reports per second are compared with the single worker run. SQL
+bound reports can only scale with spare CPU cores since pysqlite releases
+the GIL while SQLite runs; reports doing most of their work in Python (ORM
+loading, pandas) stay serialized by the GIL. On a single core, or with
+the stock database, expect no speedup or a slowdown from more workers.
+
+--check instead verifies what the runner guarantees on any machine:
+  - overlap: <workers> reports each waiting inside a statement (a sleep()
+    SQL function standing for a stalled read) finish in about the time of
+    one, not <workers> times it
+  - interrupt: a never ending statement timed out, then another one
+    cancelled, free the single worker for the next report at once
+and exits with status 1 when one fails.
+
+usage: python -m benchmarks.async_reports [--db database_x100.sqlite]
+                                          [--rounds 8] [--max-workers 8]
+       python -m benchmarks.async_reports --check [--max-workers 8]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import warnings
+
+from sqlalchemy import event, text
+
+import main
+from async_reports import AsyncReportRunner
+
+DEFAULT_REPORTS = ['task_2_table_counts', 'task_3_sql', 'task_5_missing_addresses',
+                   'task_6_sql', 'task_8_playlist_track_counts']
+
+# seconds each --check report waits, and its timeout
+CHECK_SECONDS = 0.2
+
+# a statement running until it is interrupted
+ENDLESS = """
+WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n)
+SELECT count(*) FROM n
+"""
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _register_sleep(dbapi_connection, connection_record):
+    dbapi_connection.create_function('sleep', 1, _sleep)
+
+
+def sleep_report(session, seconds):
+    return session.execute(text('SELECT sleep(:seconds)'),
+                           {'seconds': seconds}).scalar()
+
+
+def endless_report(session):
+    return session.execute(text(ENDLESS)).scalar()
+
+
+async def check_overlap(db_path, workers, seconds=CHECK_SECONDS):
+    """
+    Returns the seconds <workers> sleep reports of <seconds> took on as
+    many workers
+    """
+    async with AsyncReportRunner(db_path, workers=workers) as runner:
+        event.listen(runner.engine, 'connect', _register_sleep)
+        start = time.perf_counter()
+        await asyncio.gather(*(runner.submit(sleep_report, seconds)
+                               for _ in range(workers)))
+        return time.perf_counter() - start
+
+
+async def check_interrupt(db_path, seconds=CHECK_SECONDS):
+    """
+    Returns the seconds a single worker took to time out an endless report
+    after <seconds>, cancel another one after <seconds> and run a sleep
+    report of 0 seconds, or None when one of them didn't end as expected
+    """
+    async with AsyncReportRunner(db_path, workers=1) as runner:
+        event.listen(runner.engine, 'connect', _register_sleep)
+        start = time.perf_counter()
+        try:
+            await runner.submit(endless_report, timeout=seconds)
+            return None
+        except asyncio.TimeoutError:
+            pass
+        task = asyncio.ensure_future(runner.submit(endless_report))
+        await asyncio.sleep(seconds)
+        task.cancel()
+        try:
+            await task
+            return None
+        except asyncio.CancelledError:
+            pass
+        # only runs once the worker is out of the endless statements
+        await runner.submit(sleep_report, 0, timeout=seconds * 5)
+        return time.perf_counter() - start
+
+
+def run_checks(db_path, workers):
+    """
+    Prints the --check results and returns True when all passed
+    """
+    elapsed = asyncio.run(check_overlap(db_path, workers))
+    # one report's time plus scheduling, two reports in a row wouldn't pass
+    overlap_ok = elapsed < CHECK_SECONDS * 2
+    print('> overlap: %d reports waiting %.2f s each on %d workers took %.2f s '
+          '(%.2f s in a row): %s' % (workers, CHECK_SECONDS, workers, elapsed,
+                                     workers * CHECK_SECONDS,
+                                     'ok' if overlap_ok else 'FAILED'))
+    elapsed = asyncio.run(check_interrupt(db_path))
+    interrupt_ok = elapsed is not None and elapsed < CHECK_SECONDS * 4
+    print('> interrupt: timed out & cancelled endless reports freed the worker '
+          '%s: %s' % ('in %.2f s' % elapsed if elapsed is not None else 'late',
+                      'ok' if interrupt_ok else 'FAILED'))
+    return overlap_ok and interrupt_ok
+
+
+async def throughput(db_path, workers, names, rounds):
+    async with AsyncReportRunner(db_path, workers=workers) as runner:
+        # warms the OS / SQLite caches & opens the pooled connections
+        await runner.run_many(names * workers)
+        start = time.perf_counter()
+        await runner.run_many(names * rounds)
+        elapsed = time.perf_counter() - start
+    return len(names) * rounds / elapsed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=main.dbPath)
+    parser.add_argument('--rounds', type=int, default=8)
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--reports', nargs='+', choices=list(main.REPORTS),
+                        default=DEFAULT_REPORTS)
+    parser.add_argument('--check', action='store_true',
+                        help='verify overlap & interruption instead')
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+    main.setup(args.db).close()
+    if args.check:
+        sys.exit(0 if run_checks(args.db, args.max_workers) else 1)
+
+    print('%d reports x%d, %s' % (len(args.reports), args.rounds, args.db))
+    print('%8s %14s %9s' % ('workers', 'reports/s', 'speedup'))
+    baseline = None
+    workers = 1
+    while workers <= args.max_workers:
+        rate = asyncio.run(throughput(args.db, workers, args.reports, args.rounds))
+        baseline = baseline or rate
+        print('%8d %14.1f %8.2fx' % (workers, rate, rate / baseline))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,52 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import gc
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+import money
+import schema_cache
+
+
+def automap(db_path, money_columns=True):
+    """
+    Returns (engine, Base) for the database located in <db_path>, mapped
+    the same way main.py does. Set <money_columns> to False to keep the
+    prices & totals as Numeric (Decimal) instead of integer cents.
+    """
+    engine = create_engine('sqlite:///%s' % db_path)
+    metadata = schema_cache.load_metadata(engine, only=schema_cache.CHINOOK_TABLES)
+    if money_columns:
+        money.apply_money_type(metadata)
+    Base = automap_base(declarative_base(engine, metadata=metadata))
+    Base.prepare()
+    return engine, Base
+
+
+def new_session(engine):
+    return sessionmaker(bind=engine)()
+
+
+def measure(fn, trace_memory=True):
+    """
+    Calls <fn> and returns (result, seconds, peak traced bytes)
+    """
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
@@ -0,0 +1,104 @@
+"""
+Report latency per SQLite engine profile.
+
+Each profile runs on its own copy of the database (WAL changes the file),
+first sequentially (median ms per report) and then with all reports
+submitted to a thread pool of --threads readers sharing the engine's pool.
+Use a scaled database (see scale_data.py) for meaningful numbers.
+
+usage: python -m benchmarks.engine_profiles [--db database_x100.sqlite]
+                                            [--repeat 5] [--threads 4]
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import sessionmaker
+
+import engine_profile
+import main as reports_module
+from benchmarks.reports import REPORTS
+
+# name, create_profiled_engine keyword arguments
+CONFIGURATIONS = [
+    ('default', {'profile': 'default'}),
+    ('tuned', {'profile': 'tuned'}),
+    ('report', {'profile': 'report'}),
+    ('report+immutable', {'profile': 'report', 'immutable': True}),
+]
+
+DEFAULT_REPORTS = ['task_3_sql', 'task_6_sql', 'task_6_pandas',
+                   'task_7_artist_top_tracks', 'task_8_playlist_track_counts']
+
+
+def run_report(Session, report):
+    # stdout is redirected by main(), once for all threads
+    session = Session()
+    try:
+        start = time.perf_counter()
+        report(session)
+        return time.perf_counter() - start
+    finally:
+        session.close()
+
+
+def benchmark(db_path, config, names, repeat, threads):
+    engine = engine_profile.create_profiled_engine(db_path, pool_size=threads,
+                                                   **config)
+    Session = sessionmaker(bind=engine)
+    # first pass warms the OS / SQLite caches & the connection pool
+    for name in names:
+        run_report(Session, REPORTS[name])
+
+    sequential = {}
+    for name in names:
+        sequential[name] = statistics.median(
+            run_report(Session, REPORTS[name]) for _ in range(repeat))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda name: run_report(Session, REPORTS[name]),
+                      [name for name in names for _ in range(repeat)]))
+    concurrent = time.perf_counter() - start
+    engine.dispose()
+    return sequential, concurrent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='database.sqlite')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--reports', nargs='+', choices=list(REPORTS),
+                        default=DEFAULT_REPORTS)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+    # maps the classes the reports query, each configuration brings its engine
+    reports_module.setup(args.db).close()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for name, config in CONFIGURATIONS:
+            db_copy = os.path.join(tmp, '%s.sqlite' % name.replace('+', '_'))
+            shutil.copyfile(args.db, db_copy)
+            results.append((name,) + benchmark(db_copy, config, args.reports,
+                                               args.repeat, args.threads))
+
+    print('median ms per report, %s' % args.db)
+    print('%-22s' % 'report' + ''.join('%18s' % name for name, _, _ in results))
+    for report in args.reports:
+        print('%-22s' % report + ''.join('%18.2f' % (sequential[report] * 1000)
+                                         for _, sequential, _ in results))
+    print('%-22s' % ('all x%d, %d threads' % (args.repeat, args.threads)) +
+          ''.join('%16.0fms' % (concurrent * 1000) for _, _, concurrent in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Top K per group: SQLite window functions vs. sorting everything in Python.
+
+For each ranking the window version (ranking.top_k_per_group) is compared
+with fetching every row of the same source, sorting them all in Python
+and slicing K rows per group, the way the hand-written reports did. Both
+must return the same rows; wall time and rows fetched are printed.
+
+usage: python -m benchmarks.ranking [--db database_x100.sqlite] [--k 3]
+                                    [--repeat 5]
+"""
+import argparse
+import itertools
+import statistics
+
+from sqlalchemy import select
+
+import ranking
+from benchmarks.common import measure, new_session
+from engine_profile import create_profiled_engine
+
+# name, source, group column, order specs
+RANKINGS = [
+    ('tracks per artist', ranking.TRACK_SALES, 'ArtistId', ('-SoldCount', 'TrackId')),
+    ('albums per genre', ranking.GENRE_ALBUM_SALES, 'GenreId', ('-RevenueCents', 'AlbumId')),
+    ('artists by albums', ranking.ARTIST_ALBUMS, None, ('-AlbumCount', 'Artist', 'ArtistId')),
+    ('albums by sales', ranking.ALBUM_SALES, None, ('-RevenueCents', 'AlbumId')),
+]
+
+
+def python_top_k(session, source, group, order, k):
+    # every row leaves the database, then a full sort & a slice per group
+    rows = [dict(row) for row in
+            session.execute(select([source.selectable(session.connection())]))]
+
+    def sort_key(row):
+        return tuple(-row[spec[1:]] if spec.startswith('-') else row[spec]
+                     for spec in order)
+
+    if not group:
+        return sorted(rows, key=sort_key)[:k], len(rows)
+    rows.sort(key=lambda row: (row[group],) + sort_key(row))
+    return {key: list(itertools.islice(group_rows, k))
+            for key, group_rows in itertools.groupby(rows, key=lambda row: row[group])}, \
+        len(rows)
+
+
+def window_top_k(session, source, group, order, k):
+    result = ranking.top_k_per_group(session, source, group, order, k)
+    for rows in (result.values() if group else [result]):
+        for row in rows:
+            del row['rank']
+    fetched = sum(len(rows) for rows in result.values()) if group else len(result)
+    return (dict(result) if group else result), fetched
+
+
+def timed(fn, engine, repeat, *args):
+    timings = []
+    for _ in range(repeat):
+        session = new_session(engine)
+        (result, fetched), seconds, _ = measure(lambda: fn(session, *args),
+                                                trace_memory=False)
+        session.close()
+        timings.append(seconds)
+    return result, fetched, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='database.sqlite')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    engine = create_profiled_engine(args.db, read_only=True)
+
+    print('%-18s %12s %10s %12s %10s %8s' % ('ranking', 'python ms', 'rows',
+                                             'window ms', 'rows', 'match'))
+    for name, source, group, order in RANKINGS:
+        expected, python_rows, python_seconds = timed(
+            python_top_k, engine, args.repeat, source, group, order, args.k)
+        result, window_rows, window_seconds = timed(
+            window_top_k, engine, args.repeat, source, group, order, args.k)
+        print('%-18s %12.2f %10d %12.2f %10d %8s' % (
+            name, python_seconds * 1000, python_rows, window_seconds * 1000,
+            window_rows, result == expected))
+
+
+if __name__ == '__main__':
+    main()
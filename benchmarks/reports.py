@@ -0,0 +1,197 @@
+"""
+Benchmark suite for the paired report implementations in main.py.
+
+Every report runs on a fresh session and again on the same (warm) session,
+recording wall time, SQL statements issued, rows fetched and peak Python
+memory. Results are written as JSON so two runs can be compared and
+regressions flagged.
+
+usage:
+  python -m benchmarks.reports run [--db PATH] [--profile NAME] [--output FILE]
+                                   [--repeat N] [--reports NAME ...]
+  python -m benchmarks.reports compare BASELINE CURRENT [--threshold 0.25]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import warnings
+
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+import main
+from engine_profile import PROFILES
+from benchmarks.common import measure
+from instrumentation import instrument
+
+# the paired implementations of main.REPORTS, in main.py order
+PAIRED_REPORTS = ('task_3_sql', 'task_3_python', 'task_6_sql', 'task_6_python',
+                  'task_6_pandas', 'task_7_artist_top_tracks',
+                  'task_8_playlist_track_counts')
+
+# report name : function(session)
+REPORTS = {name: main.REPORTS[name] for name in PAIRED_REPORTS}
+
+MODES = ('fresh', 'warm')
+
+# timings below this many seconds apart are treated as noise by compare
+MIN_SECONDS_DELTA = 0.001
+
+
+def call_report(report, session):
+    # reports return their results, anything they print isn't what's measured
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return report(session)
+
+
+def _run_pass(report, Session, engine, trace_memory):
+    """
+    Runs <report> on a new session, then again on the same session.
+    Returns {mode: (seconds, statements, rows, peak bytes)}
+    """
+    session = Session()
+    stats = {}
+    try:
+        for mode in MODES:
+            with instrument(engine, mode) as queries:
+                _, seconds, peak = measure(lambda: call_report(report, session),
+                                           trace_memory=trace_memory)
+            stats[mode] = (seconds, queries.statement_count, queries.row_count,
+                           peak)
+    finally:
+        session.close()
+    return stats
+
+
+def benchmark_report(report, Session, engine, repeat):
+    """
+    Returns a result dict per mode for <report>: the median wall time of
+    <repeat> untraced passes plus counts and peak memory of a traced pass
+    """
+    timings = {mode: [] for mode in MODES}
+    for _ in range(repeat):
+        for mode, (seconds, _, _, _) in _run_pass(report, Session, engine,
+                                                  trace_memory=False).items():
+            timings[mode].append(seconds)
+    traced = _run_pass(report, Session, engine, trace_memory=True)
+
+    results = []
+    for mode in MODES:
+        _, statements, rows, peak = traced[mode]
+        results.append({
+            'mode': mode,
+            'seconds': statistics.median(timings[mode]),
+            'statements': statements,
+            'rows': rows,
+            'peak_bytes': peak,
+        })
+    return results
+
+
+def run(db_path, names, repeat, profile='default'):
+    # maps the classes the reports query, without opening the shared session
+    main.setup(db_path, profile).close()
+    engine = main.engine
+    Session = sessionmaker(bind=engine)
+    results = []
+    for name in names:
+        for result in benchmark_report(REPORTS[name], Session, engine, repeat):
+            result['report'] = name
+            results.append(result)
+    engine.dispose()
+    return {
+        'db': db_path,
+        'db_bytes': os.path.getsize(db_path),
+        'profile': profile,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Returns a list of (report, mode, metric, baseline value, current value)
+    regressions of <current> against <baseline>. Statement and row counts
+    regress on any increase, seconds and peak memory once they grow by more
+    than <threshold> (a fraction).
+    """
+    before = {(r['report'], r['mode']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        key = (result['report'], result['mode'])
+        if key not in before:
+            continue
+        old = before[key]
+        for metric in ('statements', 'rows'):
+            if result[metric] > old[metric]:
+                regressions.append(key + (metric, old[metric], result[metric]))
+        if result['seconds'] > old['seconds'] * (1 + threshold) and \
+                result['seconds'] - old['seconds'] > MIN_SECONDS_DELTA:
+            regressions.append(key + ('seconds', old['seconds'], result['seconds']))
+        if result['peak_bytes'] > old['peak_bytes'] * (1 + threshold):
+            regressions.append(key + ('peak_bytes', old['peak_bytes'],
+                                      result['peak_bytes']))
+    return regressions
+
+
+def print_results(run_results):
+    print('%-22s %-6s %10s %10s %10s %10s' % ('report', 'mode', 'ms',
+                                              'statements', 'rows', 'peak KiB'))
+    for r in run_results['results']:
+        print('%-22s %-6s %10.2f %10d %10d %10.1f' % (
+            r['report'], r['mode'], r['seconds'] * 1000, r['statements'],
+            r['rows'], r['peak_bytes'] / 1024.0))
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='benchmark the reports')
+    run_parser.add_argument('--db', default=main.dbPath)
+    run_parser.add_argument('--profile', choices=list(PROFILES), default='default',
+                            help='engine profile, note that WAL profiles '
+                                 'switch the database file to WAL mode')
+    run_parser.add_argument('--output', default='bench_reports.json')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--reports', nargs='+', choices=list(REPORTS),
+                            default=list(REPORTS))
+
+    compare_parser = commands.add_parser('compare', help='compare two runs')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.25)
+
+    args = parser.parse_args(argv)
+    warnings.filterwarnings('ignore')
+
+    if args.command == 'run':
+        results = run(args.db, args.reports, args.repeat, args.profile)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print_results(results)
+        print('> results written to %s' % args.output)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    for report, mode, metric, old, new in regressions:
+        print('REGRESSION %s (%s) %s: %s -> %s' % (report, mode, metric, old, new))
+    print('> %d regression(s)' % len(regressions))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,86 @@
+"""
+Catalogue search: the TrackSearch FTS5 index vs. LIKE '%term%' scans.
+
+The database is copied to a temporary directory and the index installed
+there, the original is never written to. For each search the LIKE version
+ORs a '%token%' match over the track name, composer, album title & artist
+name of every track (every token must match one of them), the FTS version
+is search.search(). Median wall time and hit counts are printed; LIKE
+also matches inside words so it finds at least as many tracks.
+
+usage: python -m benchmarks.search [--db database_x100.sqlite] [--repeat 5]
+                                   [TERMS ...]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+
+from sqlalchemy import text
+
+import search
+from benchmarks.common import measure
+from engine_profile import create_profiled_engine
+
+TERMS = ['love', 'iron maiden', 'beethoven symphony', 'rock and roll', 'acust', 'zz']
+
+LIKE_SEARCH = """
+SELECT t.TrackId, t.Name AS Track, al.Title AS Album, ar.Name AS Artist
+FROM Track t
+LEFT JOIN Album al ON al.AlbumId = t.AlbumId
+LEFT JOIN Artist ar ON ar.ArtistId = al.ArtistId
+WHERE %(where)s
+ORDER BY t.TrackId
+"""
+
+LIKE_TOKEN = "(t.Name LIKE :%(p)s OR t.Composer LIKE :%(p)s " \
+             "OR al.Title LIKE :%(p)s OR ar.Name LIKE :%(p)s)"
+
+
+def like_search(conn, terms):
+    tokens = search._TOKEN.findall(terms)
+    where = ' AND '.join(LIKE_TOKEN % {'p': 't%d' % i} for i in range(len(tokens)))
+    params = {'t%d' % i: '%%%s%%' % token for i, token in enumerate(tokens)}
+    return conn.execute(text(LIKE_SEARCH % {'where': where}), params).fetchall()
+
+
+def fts_search(conn, terms):
+    return search.search(conn, terms, limit=-1)
+
+
+def timed(fn, engine, repeat, terms):
+    timings = []
+    for _ in range(repeat):
+        with engine.connect() as conn:
+            rows, seconds, _ = measure(lambda: fn(conn, terms), trace_memory=False)
+        timings.append(seconds)
+    return rows, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('terms', nargs='*', default=TERMS)
+    parser.add_argument('--db', default='database.sqlite')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, os.path.basename(args.db))
+        shutil.copy(args.db, db_path)
+        engine = create_profiled_engine(db_path)
+        _, seconds, _ = measure(lambda: search.install(engine), trace_memory=False)
+        print('> indexed %s in %.2f s' % (args.db, seconds))
+
+        print('%-20s %10s %8s %10s %8s' % ('terms', 'like ms', 'hits', 'fts ms', 'hits'))
+        for terms in args.terms:
+            like_rows, like_seconds = timed(like_search, engine, args.repeat, terms)
+            fts_rows, fts_seconds = timed(fts_search, engine, args.repeat, terms)
+            print('%-20s %10.2f %8d %10.2f %8d' % (
+                terms, like_seconds * 1000, len(like_rows), fts_seconds * 1000,
+                len(fts_rows)))
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Startup timing: live reflection vs. the cached schema snapshot.
+
+Each trial builds a fresh engine and automaps every table the way main.py
+does, once reflecting the database and once from schema_cache's snapshot.
+
+usage: python -m benchmarks.startup [--db database.sqlite] [--trials 20]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import MetaData, create_engine
+from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.ext.declarative import declarative_base
+
+import schema_cache
+
+
+def reflect_start(db_path):
+    """
+    Cold start: reflect all tables and generate the mapped classes
+    """
+    engine = create_engine('sqlite:///%s' % db_path)
+    Base = automap_base(declarative_base(engine, metadata=MetaData()))
+    Base.prepare(engine, reflect=True)
+    engine.dispose()
+    return Base
+
+
+def snapshot_start(db_path, cache_path):
+    """
+    Warm start: load the pickled schema and generate the mapped classes
+    """
+    engine = create_engine('sqlite:///%s' % db_path)
+    metadata = schema_cache.load_metadata(engine, cache_path)
+    Base = automap_base(declarative_base(engine, metadata=metadata))
+    Base.prepare()
+    engine.dispose()
+    return Base
+
+
+def time_trials(fn, trials):
+    timings = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='database.sqlite')
+    parser.add_argument('--trials', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'schema.pickle')
+        # first call writes the snapshot, every later one reads it
+        snapshot_start(args.db, cache_path)
+
+        cold = reflect_start(args.db)
+        warm = snapshot_start(args.db, cache_path)
+        assert sorted(cold.classes.keys()) == sorted(warm.classes.keys())
+
+        results = [
+            ('reflect', time_trials(lambda: reflect_start(args.db), args.trials)),
+            ('snapshot', time_trials(lambda: snapshot_start(args.db, cache_path),
+                                     args.trials)),
+        ]
+
+    print('%-10s %10s %10s %10s' % ('startup', 'median ms', 'min ms', 'max ms'))
+    for name, timings in results:
+        print('%-10s %10.2f %10.2f %10.2f' % (name,
+                                              statistics.median(timings) * 1000,
+                                              min(timings) * 1000,
+                                              max(timings) * 1000))
+    speedup = statistics.median(results[0][1]) / statistics.median(results[1][1])
+    print('> snapshot start is %0.1fx faster than live reflection' % speedup)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+SQL-side data-quality profiling of the address columns (Task 5).
+
+missing_component_counts profiles every source in one aggregate statement
+(SUM(CASE WHEN ... IS NULL OR trim(...) = '' ...) per component) and
+iter_incomplete_keys pages through the primary keys of the offending rows on
+demand, so large tables are audited without building any Address objects.
+A component is missing when it is NULL or empty (addresses.is_blank), for
+the counts and the keys alike.
+"""
+from sqlalchemy import case, func, inspect, literal, or_, select, union_all
+
+from addresses import is_blank, missing_flag
+
+# report names of the address components, in address_select column order
+ADDRESS_COMPONENTS = ('street', 'city', 'zip_code', 'state', 'country')
+
+PAGE_SIZE = 500
+
+
+def _component_columns(mapped_class, columns):
+    return [getattr(mapped_class, c) for c in columns]
+
+
+def missing_component_counts(session, sources):
+    """
+    Counts the rows with a NULL / empty value per address component.
+
+    <sources> is a list of (label, mapped_class, address columns) tuples,
+    e.g. ('Customer', Customers, CUSTOMER_ADDRESS_COLUMNS). All sources are
+    profiled by a single UNION ALL of aggregate selects. Returns a dict of
+    label : {'rows': .., 'incomplete': .., 'street': .., 'city': .., ...}
+    where 'incomplete' counts rows with any NULL / empty component, as
+    flagged by addresses.missing_flag.
+    """
+    selects = []
+    for label, mapped_class, columns in sources:
+        cols = _component_columns(mapped_class, columns)
+        incomplete = func.sum(missing_flag(mapped_class, columns))
+        aggregates = [func.sum(case([(is_blank(c), 1)], else_=0))
+                      for c in cols]
+        selects.append(select([literal(label), func.count(), incomplete] +
+                              aggregates).select_from(mapped_class.__table__))
+
+    query = selects[0] if len(selects) == 1 else union_all(*selects)
+    report = {}
+    for row in session.execute(query):
+        counts = dict(zip(ADDRESS_COMPONENTS, (n or 0 for n in row[3:])))
+        counts['rows'] = row[1]
+        counts['incomplete'] = row[2] or 0
+        report[row[0]] = counts
+    return report
+
+
+def iter_incomplete_keys(session, mapped_class, columns, component=None,
+                         page_size=PAGE_SIZE):
+    """
+    Yields pages (lists) of primary keys of <mapped_class> rows whose address
+    <component> (one of ADDRESS_COMPONENTS) is NULL / empty, or with any
+    blank component when <component> is None. Pages are fetched one at a
+    time with keyset pagination (WHERE pk > last key ORDER BY pk LIMIT n).
+    """
+    cols = _component_columns(mapped_class, columns)
+    if component is None:
+        condition = or_(*[is_blank(c) for c in cols])
+    else:
+        condition = is_blank(cols[ADDRESS_COMPONENTS.index(component)])
+
+    pk = inspect(mapped_class).primary_key[0]
+    query = select([pk]).where(condition).order_by(pk).limit(page_size)
+    last_key = None
+    while True:
+        page_query = query if last_key is None else query.where(pk > last_key)
+        page = [row[0] for row in session.execute(page_query)]
+        if not page:
+            break
+        yield page
+        if len(page) < page_size:
+            break
+        last_key = page[-1]
@@ -0,0 +1,109 @@
+"""
+SQLite engine tuning profiles.
+
+A profile is a set of PRAGMAs applied to every new DBAPI connection by a
+'connect' event hook:
+  default  -> SQLite defaults (rollback journal, ~2 MB page cache, no mmap)
+  tuned    -> WAL journal, 256 MB memory-mapped I/O, 64 MB page cache and
+              in-memory temp B-trees (sorts / GROUP BY)
+  report   -> tuned + query_only, for workers that only run reports
+Engines can also open the file read-only (mode=ro) or as immutable (no
+locking or change detection at all, for static snapshots) and keep a
+QueuePool of connections sized for concurrent readers.
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+# PRAGMAs are applied in this order, journal_mode first since query_only
+# forbids changing it afterwards
+PRAGMA_ORDER = ('journal_mode', 'synchronous', 'mmap_size', 'cache_size',
+                'temp_store', 'query_only')
+
+PROFILES = {
+    'default': {},
+    'tuned': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative: size in KiB
+        'temp_store': 'MEMORY',
+    },
+}
+PROFILES['report'] = dict(PROFILES['tuned'], query_only=1)
+
+# PRAGMAs that write to the database file, skipped on read-only connections
+WRITE_PRAGMAS = ('journal_mode',)
+
+
+def profile_pragmas(profile='default', read_only=False, **overrides):
+    """
+    Returns the ordered list of (pragma, value) of <profile>, updated with
+    <overrides> (a value of None removes the pragma)
+    """
+    pragmas = dict(PROFILES[profile], **overrides)
+    if read_only:
+        for name in WRITE_PRAGMAS:
+            pragmas.pop(name, None)
+    ordered = [name for name in PRAGMA_ORDER if name in pragmas] + \
+        sorted(name for name in pragmas if name not in PRAGMA_ORDER)
+    return [(name, pragmas[name]) for name in ordered if pragmas[name] is not None]
+
+
+def file_pragmas(profile='default'):
+    """
+    Returns the (pragma, value) of <profile> that persistently change the
+    database file when it's opened read-write, e.g. journal_mode=WAL
+    """
+    return [(name, value) for name, value in profile_pragmas(profile)
+            if name in WRITE_PRAGMAS]
+
+
+def database_url(db_path, read_only=False, immutable=False):
+    """
+    Returns the SQLAlchemy url of <db_path>, as a read-only URI filename
+    when <read_only> or <immutable> is set
+    """
+    if not (read_only or immutable):
+        return 'sqlite:///%s' % db_path
+    params = ['mode=ro']
+    if immutable:
+        params.append('immutable=1')
+    return 'sqlite:///file:%s?%s&uri=true' % (db_path, '&'.join(params))
+
+
+def apply_pragmas(engine, pragmas):
+    """
+    Registers a 'connect' hook on <engine> executing <pragmas> (a list of
+    (pragma, value)) on every new DBAPI connection
+    """
+    statements = ['PRAGMA %s=%s' % (name, value) for name, value in pragmas]
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    return engine
+
+
+def create_profiled_engine(db_path, profile='default', read_only=False,
+                           immutable=False, pool_size=None, echo=False,
+                           **pragma_overrides):
+    """
+    Creates an engine for the sqlite database located in <db_path> using
+    the PRAGMAs of <profile> (see PROFILES). With <pool_size> connections
+    are kept in a QueuePool of that size and may be shared across threads,
+    otherwise SQLAlchemy's default pool for sqlite files is used.
+    """
+    kwargs = {'echo': echo}
+    if pool_size:
+        kwargs.update(poolclass=QueuePool, pool_size=pool_size, max_overflow=0,
+                      connect_args={'check_same_thread': False})
+    engine = create_engine(database_url(db_path, read_only, immutable), **kwargs)
+    pragmas = profile_pragmas(profile, read_only=read_only or immutable,
+                              **pragma_overrides)
+    if pragmas:
+        apply_pragmas(engine, pragmas)
+    return engine
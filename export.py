@@ -0,0 +1,189 @@
+"""
+Streaming export of report rows to CSV or NDJSON files.
+
+The nested report structures (Task 7's artist dict, Task 4's Address
+objects) hold every row at once. Exports instead read the flat report
+query <chunk size> rows at a time from the cursor and write each chunk
+before fetching the next, so memory stays the same whatever the size of
+the catalogue. Files ending in .gz (or --gzip) are compressed on the fly.
+Amounts are exported as integer cents.
+
+usage: python export.py {artist_track_sales,album_revenue,addresses} OUTPUT
+                        [--format csv|ndjson] [--gzip] [--db PATH]
+                        [--chunk-size N]
+"""
+import argparse
+import collections
+import csv
+import gzip
+import json
+import time
+
+from sqlalchemy import column, literal, select, table, text, union_all
+
+import track_sales
+from addresses import CUSTOMER_ADDRESS_COLUMNS, INVOICE_ADDRESS_COLUMNS, missing_flag
+from engine_profile import create_profiled_engine
+
+CHUNK_SIZE = 5000
+
+FORMATS = ('csv', 'ndjson')
+
+# album sales summed from the per track sales of %(sales)s (see track_sales)
+ALBUM_REVENUE = """
+SELECT al.AlbumId, al.Title AS Album, ar.Name AS Artist,
+       coalesce(sum(s.SoldCount), 0) AS SoldCount,
+       coalesce(sum(s.RevenueCents), 0) AS RevenueCents
+FROM Album al
+JOIN Artist ar ON ar.ArtistId = al.ArtistId
+LEFT JOIN Track t ON t.AlbumId = al.AlbumId
+LEFT JOIN %(sales)s s ON s.TrackId = t.TrackId
+GROUP BY al.AlbumId
+ORDER BY al.AlbumId
+"""
+
+# export columns of the address components, in address_select order
+ADDRESS_LABELS = ('Street', 'City', 'PostalCode', 'State', 'Country')
+
+# source label, table, key & address columns of the exported addresses
+ADDRESS_SOURCES = [
+    ('Customer', 'Customer', 'CustomerId', CUSTOMER_ADDRESS_COLUMNS),
+    ('Invoice', 'Invoice', 'InvoiceId', INVOICE_ADDRESS_COLUMNS),
+]
+
+
+def artist_track_sales_query(conn):
+    return text(track_sales.ARTIST_TRACK_SALES % {
+        'sales': track_sales.sales_source(conn)})
+
+
+def album_revenue_query(conn):
+    return text(ALBUM_REVENUE % {'sales': track_sales.sales_source(conn)})
+
+
+def addresses_query(conn):
+    # customer & billing addresses flattened to one row each, Missing is
+    # flagged by the same expression as the reports (addresses.missing_flag)
+    selects = []
+    for label, table_name, key, columns in ADDRESS_SOURCES:
+        source = table(table_name, *[column(c) for c in (key,) + columns])
+        selects.append(select(
+            [literal(label).label('Source'), source.c[key].label('Id')] +
+            [source.c[c].label(name) for c, name in zip(columns, ADDRESS_LABELS)] +
+            [missing_flag(source.c, columns).label('Missing')]))
+    return union_all(*selects)
+
+
+# export name : function(connection) returning the query to export
+EXPORTS = collections.OrderedDict([
+    ('artist_track_sales', artist_track_sales_query),
+    ('album_revenue', album_revenue_query),
+    ('addresses', addresses_query),
+])
+
+
+class ExportStats(collections.namedtuple('ExportStats', 'rows seconds')):
+    __slots__ = ()
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class CsvWriter(object):
+
+    def __init__(self, stream, columns):
+        self._writer = csv.writer(stream)
+        self._writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+
+
+class NdjsonWriter(object):
+
+    def __init__(self, stream, columns):
+        self._stream = stream
+        self._columns = columns
+
+    def write_rows(self, rows):
+        columns = self._columns
+        self._stream.write(''.join(
+            json.dumps(dict(zip(columns, row)), default=str) + '\n'
+            for row in rows))
+
+
+WRITERS = {'csv': CsvWriter, 'ndjson': NdjsonWriter}
+
+
+def open_output(path, compress=None):
+    """
+    Opens <path> for writing text, gzip compressed when <compress> is True
+    (default: when <path> ends with .gz)
+    """
+    if compress is None:
+        compress = path.endswith('.gz')
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def format_of(path):
+    """
+    Returns the export format matching the extension of <path>
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def export_query(conn, query, stream, fmt='csv', chunk_size=CHUNK_SIZE):
+    """
+    Writes the rows of <query> to the text <stream> as <fmt> (see FORMATS),
+    <chunk_size> rows at a time. Returns the ExportStats.
+    """
+    start = time.perf_counter()
+    result = conn.execute(query)
+    writer = WRITERS[fmt](stream, list(result.keys()))
+    rows = 0
+    while True:
+        chunk = result.fetchmany(chunk_size)
+        if not chunk:
+            break
+        writer.write_rows(chunk)
+        rows += len(chunk)
+    return ExportStats(rows, time.perf_counter() - start)
+
+
+def export(engine, name, path, fmt=None, compress=None, chunk_size=CHUNK_SIZE):
+    """
+    Exports the report <name> (see EXPORTS) of the database bound to
+    <engine> to the file <path> and returns the ExportStats
+    """
+    fmt = fmt or format_of(path)
+    with engine.connect() as conn, open_output(path, compress) as stream:
+        return export_query(conn, EXPORTS[name](conn), stream, fmt, chunk_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('export', choices=list(EXPORTS))
+    parser.add_argument('output')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='default: from the output extension')
+    parser.add_argument('--gzip', action='store_true', default=None,
+                        help='default: when the output ends with .gz')
+    parser.add_argument('--db', default='database.sqlite')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    engine = create_profiled_engine(args.db, read_only=True)
+    stats = export(engine, args.export, args.output, args.format, args.gzip,
+                   args.chunk_size)
+    engine.dispose()
+    print('> %s: %d rows written to %s in %0.2fs (%d rows/s)' % (
+        args.export, stats.rows, args.output, stats.seconds,
+        stats.rows_per_second))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Sales revenue rolled up the Employee.ReportsTo management tree.
+
+Revenue reaches the org chart through Customer.SupportRepId -> Invoice.
+One WITH RECURSIVE query
+  - walks the tree down from the root(s) (subtree: EmployeeId = <root>),
+  - sums the invoices of the customers each employee supports (direct),
+  - credits every direct revenue to each manager above its employee up to
+    the root, which is one step per level of the support reps only, rather
+    than one lazy ReportsTo / Customer load per employee and level,
+so every employee of the subtree gets its direct and total (own plus all
+downstream) revenue. The walk never enters an employee already on its path,
+so a ReportsTo cycle below the root is listed (and credited) once instead
+of repeating until MAX_WALK_DEPTH. <max_depth> only limits the employees listed, totals
+always include the whole subtree below them. Amounts are integer cents.
+
+usage: python hierarchy.py [--db PATH] [--root EMPLOYEE_ID] [--depth N]
+"""
+import argparse
+import collections
+
+from sqlalchemy import text
+
+from engine_profile import create_profiled_engine
+from money import cents_to_decimal
+
+# bounds the walk down very deep trees (cycles are cut by the Path check)
+MAX_WALK_DEPTH = 1000
+
+REVENUE_ROLLUP = """
+WITH RECURSIVE
+subtree(EmployeeId, Depth, Path) AS (
+    SELECT EmployeeId, 0, printf('%%010d', EmployeeId)
+    FROM Employee
+    WHERE %(roots)s
+    UNION ALL
+    SELECT e.EmployeeId, s.Depth + 1, s.Path || printf('/%%010d', e.EmployeeId)
+    FROM Employee e
+    JOIN subtree s ON e.ReportsTo = s.EmployeeId
+    -- ids are fixed width, so this only matches an employee already visited
+    WHERE s.Depth < :max_walk_depth
+      AND instr(s.Path, printf('%%010d', e.EmployeeId)) = 0
+),
+direct(EmployeeId, RevenueCents) AS (
+    SELECT c.SupportRepId, sum(CAST(ROUND(i.Total * 100) AS INTEGER))
+    FROM subtree s
+    JOIN Customer c ON c.SupportRepId = s.EmployeeId
+    JOIN Invoice i ON i.CustomerId = c.CustomerId
+    GROUP BY c.SupportRepId
+),
+credit(EmployeeId, Depth, RevenueCents) AS (
+    SELECT d.EmployeeId, s.Depth, d.RevenueCents
+    FROM direct d
+    JOIN subtree s ON s.EmployeeId = d.EmployeeId
+    UNION ALL
+    SELECT e.ReportsTo, c.Depth - 1, c.RevenueCents
+    FROM credit c
+    JOIN Employee e ON e.EmployeeId = c.EmployeeId
+    WHERE c.Depth > 0
+),
+total(EmployeeId, RevenueCents) AS (
+    SELECT EmployeeId, sum(RevenueCents)
+    FROM credit
+    GROUP BY EmployeeId
+)
+SELECT s.EmployeeId, e.FirstName || ' ' || e.LastName AS Name, e.Title,
+       e.ReportsTo, s.Depth, coalesce(d.RevenueCents, 0) AS DirectCents,
+       coalesce(t.RevenueCents, 0) AS TotalCents
+FROM subtree s
+JOIN Employee e ON e.EmployeeId = s.EmployeeId
+LEFT JOIN direct d ON d.EmployeeId = s.EmployeeId
+LEFT JOIN total t ON t.EmployeeId = s.EmployeeId
+WHERE s.Depth <= :max_depth
+ORDER BY s.Path
+"""
+
+EmployeeRevenue = collections.namedtuple(
+    'EmployeeRevenue',
+    'EmployeeId Name Title ReportsTo Depth DirectCents TotalCents')
+
+
+def revenue_rollup(session, root=None, max_depth=None):
+    """
+    Returns the EmployeeRevenue of every employee of the tree below <root>
+    (an EmployeeId, default: the top of the org chart) down to <max_depth>
+    levels under it, in depth-first order
+    """
+    roots = 'ReportsTo IS NULL' if root is None else 'EmployeeId = :root'
+    params = {'root': root, 'max_walk_depth': MAX_WALK_DEPTH,
+              'max_depth': MAX_WALK_DEPTH if max_depth is None else max_depth}
+    result = session.execute(text(REVENUE_ROLLUP % {'roots': roots}), params)
+    return [EmployeeRevenue._make(row) for row in result]
+
+
+def format_rollup(rows):
+    """
+    Returns the printable, indented org chart of <rows>
+    """
+    return '\n'.join('%s%s (%s): direct %s, total %s' % (
+        '  ' * row.Depth, row.Name, row.Title, cents_to_decimal(row.DirectCents),
+        cents_to_decimal(row.TotalCents)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default='database.sqlite')
+    parser.add_argument('--root', type=int, help='EmployeeId of the subtree root')
+    parser.add_argument('--depth', type=int, help='levels listed under the root')
+    args = parser.parse_args()
+
+    engine = create_profiled_engine(args.db, read_only=True)
+    with engine.connect() as conn:
+        print(format_rollup(revenue_rollup(conn, args.root, args.depth)))
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+"""
+Index advisor for the report queries of main.py.
+
+Every report of main.REPORTS is run once while its statements are
+captured, then each SELECT is explained with EXPLAIN QUERY PLAN:
+  - full table scans and temp B-trees (GROUP BY / ORDER BY sorts) are
+    flagged per report
+  - a table scanned or searched without a covering index, while the
+    query only reads a few of its columns, gets a covering index proposal:
+    join / filter / GROUP BY columns first, then the other columns read
+    (e.g. InvoiceLine(TrackId, UnitPrice, Quantity) for the sales rollups)
+  - proposals already served by an existing index (their columns leading
+    it) are dropped
+  - indexes duplicating the INTEGER PRIMARY KEY (rowid) or another index
+    (like the Chinook IPK_* ones), or leading a proposal (like
+    IFK_TrackGenreId for Track(GenreId, AlbumId)), are reported as
+    redundant, they only cost writes
+With --apply the proposals are created (and the redundant indexes dropped
+with --drop-redundant) on a copy of the database, and the reports are
+timed before and after. The database itself is only read.
+
+usage: python index_advisor.py [--db PATH] [--reports NAME ...]
+                               [--apply] [--drop-redundant] [--repeat 5]
+"""
+import argparse
+import collections
+import os
+import re
+import shutil
+import statistics
+import tempfile
+import time
+import warnings
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+
+import main
+from engine_profile import create_profiled_engine
+
+REPEAT = 5
+
+# plan details of SQLite >= 3.24, e.g. 'SCAN i', 'SCAN a USING COVERING
+# INDEX IFK_AlbumArtistId', 'SEARCH t USING INDEX IFK_TrackAlbumId (AlbumId=?)'
+_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?( USING (COVERING )?INDEX (\w+))?')
+_SEARCH = re.compile(r'^SEARCH (?:TABLE )?(\w+)(?: AS (\w+))? USING (COVERING )?INDEX (\w+)')
+_TEMP_BTREE = re.compile(r'USE TEMP B-TREE FOR (.*)')
+
+_QUOTES = re.compile(r'["\[\]`]')
+_FROM = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.I)
+_COLUMN_REF = re.compile(r'\b(\w+)\.(\w+)\b')
+_KEY_LEFT = re.compile(r'\b(\w+)\.(\w+)\s*(?:=|\bIN\b)', re.I)
+_KEY_RIGHT = re.compile(r'=\s*(\w+)\.(\w+)\b')
+_GROUP_BY = re.compile(r'\bGROUP BY\b(.*?)(?:\bHAVING\b|\bORDER BY\b|\bLIMIT\b|'
+                       r'\bUNION\b|\)|$)', re.I | re.S)
+_KEYWORDS = {'on', 'where', 'inner', 'left', 'right', 'outer', 'cross', 'join',
+             'natural', 'group', 'order', 'limit', 'union', 'having', 'using'}
+
+Finding = collections.namedtuple('Finding', 'report kind table detail')
+
+
+class IndexProposal(collections.namedtuple('IndexProposal', 'table columns reports')):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return 'IX_%s_%s' % (self.table, '_'.join(self.columns))
+
+    @property
+    def ddl(self):
+        return 'CREATE INDEX IF NOT EXISTS [%s] ON [%s] (%s)' % (
+            self.name, self.table, ', '.join('[%s]' % c for c in self.columns))
+
+
+class Schema(object):
+    """
+    Tables, columns and indexes of the database of <conn>
+    """
+
+    def __init__(self, conn):
+        names = [row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%'"))]
+        self.tables = {name.lower(): name for name in names}
+        self.columns = {}
+        self.rowid_column = {}
+        self.indexes = {}
+        for table in names:
+            info = conn.execute(text('PRAGMA table_info([%s])' % table)).fetchall()
+            self.columns[table] = [row[1] for row in info]
+            pk = [row for row in info if row[5]]
+            if len(pk) == 1 and pk[0][2].upper() == 'INTEGER':
+                self.rowid_column[table] = pk[0][1]
+            indexes = []
+            for row in conn.execute(text('PRAGMA index_list([%s])' % table)):
+                columns = [c[2] for c in conn.execute(
+                    text('PRAGMA index_info([%s])' % row[1]))]
+                # (name, columns, origin: c = CREATE INDEX, u / pk = constraint)
+                indexes.append((row[1], columns, row[3]))
+            self.indexes[table] = indexes
+
+    def column(self, table, name):
+        for column in self.columns[table]:
+            if column.lower() == name.lower():
+                return column
+        return None
+
+
+def capture_statements(engine, report, session):
+    """
+    Runs <report> on <session> and returns the distinct (statement,
+    parameters) of the SELECTs it issued on <engine>
+    """
+    statements = collections.OrderedDict()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.setdefault(statement, parameters)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        report(session)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return list(statements.items())
+
+
+def explain(conn, statement, parameters):
+    """
+    Returns the plan details of <statement>
+    """
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _aliases(schema, sql):
+    aliases = {}
+    for table, alias in _FROM.findall(sql):
+        table = schema.tables.get(table.lower())
+        if table is None:
+            continue
+        aliases[table.lower()] = table
+        if alias and alias.lower() not in _KEYWORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def _referenced_columns(schema, sql, aliases, alias):
+    """
+    Returns the (key columns, other columns) of the table <alias> read by
+    <sql>, key columns being the ones compared in joins / filters or grouped
+    """
+    table = aliases[alias.lower()]
+
+    def columns_of(refs):
+        found = []
+        for ref_alias, name in refs:
+            if ref_alias.lower() != alias.lower():
+                continue
+            column = schema.column(table, name)
+            if column is not None and column not in found:
+                found.append(column)
+        return found
+
+    key_refs = _KEY_LEFT.findall(sql) + _KEY_RIGHT.findall(sql)
+    for group_by in _GROUP_BY.findall(sql):
+        key_refs.extend(_COLUMN_REF.findall(group_by))
+    keys = columns_of(key_refs)
+    others = [c for c in columns_of(_COLUMN_REF.findall(sql)) if c not in keys]
+    return keys, others
+
+
+def analyze_statement(schema, report, sql, plan):
+    """
+    Returns the findings & IndexProposals for one explained statement
+    """
+    sql = _QUOTES.sub('', sql)
+    aliases = _aliases(schema, sql)
+    findings, proposals = [], []
+    for detail in plan:
+        scan, search = _SCAN.match(detail), _SEARCH.match(detail)
+        temp = _TEMP_BTREE.search(detail)
+        if temp:
+            findings.append(Finding(report, 'temp b-tree', None,
+                                    'temp B-tree for %s' % temp.group(1)))
+            continue
+        if scan:
+            alias, covering = scan.group(2) or scan.group(1), scan.group(4)
+        elif search:
+            alias, covering = search.group(2) or search.group(1), search.group(3)
+        else:
+            continue
+        if covering or alias.lower() not in aliases:
+            continue
+        table = aliases[alias.lower()]
+        if scan:
+            findings.append(Finding(report, 'full scan', table, detail))
+        keys, others = _referenced_columns(schema, sql, aliases, alias)
+        columns = [c for c in keys + others if c != schema.rowid_column.get(table)]
+        needed = [c for c in schema.columns[table] if c != schema.rowid_column.get(table)]
+        # an index of (nearly) every column is just a second copy of the table
+        if keys and columns and len(columns) < len(needed):
+            proposals.append(IndexProposal(table, tuple(columns), (report,)))
+    return findings, proposals
+
+
+def merge_proposals(proposals):
+    """
+    Returns <proposals> without the ones whose columns are a prefix of
+    another proposal on the same table, which also serves their reports
+    """
+    merged = []
+    for proposal in sorted(proposals, key=lambda p: -len(p.columns)):
+        for i, kept in enumerate(merged):
+            if kept.table == proposal.table and \
+                    kept.columns[:len(proposal.columns)] == proposal.columns:
+                reports = kept.reports + tuple(r for r in proposal.reports
+                                               if r not in kept.reports)
+                merged[i] = kept._replace(reports=reports)
+                break
+        else:
+            merged.append(proposal)
+    return merged
+
+
+def check_existing(schema, proposals):
+    """
+    Returns (proposals, superseded): the <proposals> no existing index of
+    their table already starts with, and a list of (table, index, reason)
+    of the droppable existing indexes leading one of the kept proposals
+    """
+    kept, superseded = [], []
+    for proposal in proposals:
+        columns = list(proposal.columns)
+        indexes = schema.indexes.get(proposal.table, [])
+        if any(index_columns[:len(columns)] == columns
+               for _, index_columns, _ in indexes):
+            continue
+        kept.append(proposal)
+        for name, index_columns, origin in indexes:
+            if origin == 'c' and columns[:len(index_columns)] == index_columns:
+                superseded.append((proposal.table, name,
+                                   'made redundant by %s' % proposal.name))
+    return kept, superseded
+
+
+def redundant_indexes(schema):
+    """
+    Returns a list of (table, index, reason) of the droppable indexes that
+    duplicate the rowid or the leading columns of another index
+    """
+    redundant = []
+    for table, indexes in sorted(schema.indexes.items()):
+        for name, columns, origin in indexes:
+            if origin != 'c':
+                # constraint indexes can't be dropped
+                continue
+            if columns == [schema.rowid_column.get(table)]:
+                redundant.append((table, name, 'duplicates the INTEGER PRIMARY KEY'))
+                continue
+            for other, other_columns, _ in indexes:
+                if other != name and other_columns[:len(columns)] == columns and \
+                        (len(other_columns) > len(columns) or other.startswith('sqlite_')):
+                    redundant.append((table, name, 'duplicates %s' % other))
+                    break
+    return redundant
+
+
+def advise(engine, names):
+    """
+    Returns (findings, proposals, redundant indexes) for the reports
+    <names> run on <engine>
+    """
+    Session = sessionmaker(bind=engine)
+    findings, proposals = [], []
+    with engine.connect() as conn:
+        schema = Schema(conn)
+        for name in names:
+            session = Session()
+            try:
+                statements = capture_statements(engine, main.REPORTS[name], session)
+            finally:
+                session.close()
+            for statement, parameters in statements:
+                plan = explain(conn, statement, parameters)
+                found, proposed = analyze_statement(schema, name, statement, plan)
+                findings.extend(f for f in found if f not in findings)
+                proposals.extend(proposed)
+    proposals, superseded = check_existing(schema, merge_proposals(proposals))
+    return findings, proposals, redundant_indexes(schema) + superseded
+
+
+def time_reports(db_path, names, repeat=REPEAT):
+    """
+    Returns {report name: median seconds} on a fresh engine for <db_path>
+    """
+    engine = create_profiled_engine(db_path)
+    Session = sessionmaker(bind=engine)
+    timings = {}
+    for name in names:
+        durations = []
+        # the first run warms the caches
+        for _ in range(repeat + 1):
+            session = Session()
+            start = time.perf_counter()
+            main.REPORTS[name](session)
+            durations.append(time.perf_counter() - start)
+            session.close()
+        timings[name] = statistics.median(durations[1:])
+    engine.dispose()
+    return timings
+
+
+def apply_indexes(db_path, proposals, drop=()):
+    """
+    Creates the <proposals> in the database located in <db_path>, drops the
+    indexes named in <drop> and refreshes the planner statistics
+    """
+    engine = create_profiled_engine(db_path)
+    with engine.begin() as conn:
+        for proposal in proposals:
+            conn.execute(text(proposal.ddl))
+        for name in drop:
+            conn.execute(text('DROP INDEX IF EXISTS [%s]' % name))
+        conn.execute(text('ANALYZE'))
+    engine.dispose()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=main.dbPath)
+    parser.add_argument('--reports', nargs='+', choices=list(main.REPORTS),
+                        default=list(main.REPORTS))
+    parser.add_argument('--apply', action='store_true',
+                        help='benchmark the proposals on a copy of the db')
+    parser.add_argument('--drop-redundant', action='store_true',
+                        help='also drop the redundant indexes on the copy')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    main.setup(args.db).close()
+    engine = create_profiled_engine(args.db, read_only=True)
+    findings, proposals, redundant = advise(engine, args.reports)
+    engine.dispose()
+
+    print('> findings')
+    for finding in findings:
+        print('  %-30s %-12s %s' % (finding.report, finding.kind, finding.detail))
+    print('> redundant indexes')
+    for table, name, reason in redundant:
+        print('  %-30s %s' % ('%s on %s' % (name, table), reason))
+    print('> proposed indexes')
+    for proposal in proposals:
+        print('  %s;  -- %s' % (proposal.ddl, ', '.join(proposal.reports)))
+    if not args.apply:
+        return
+
+    drop = [name for _, name, _ in redundant] if args.drop_redundant else []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_copy = os.path.join(tmp, os.path.basename(args.db))
+        shutil.copyfile(args.db, db_copy)
+        before = time_reports(db_copy, args.reports, args.repeat)
+        apply_indexes(db_copy, proposals, drop)
+        after = time_reports(db_copy, args.reports, args.repeat)
+
+    print('> median ms per report, before / after')
+    print('  %-30s %10s %10s %9s' % ('report', 'before', 'after', 'speedup'))
+    for name in args.reports:
+        print('  %-30s %10.2f %10.2f %8.2fx' % (name, before[name] * 1000,
+                                               after[name] * 1000,
+                                               before[name] / after[name]))
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,233 @@
+"""
+Query instrumentation: per report statement stats and N+1 detection.
+
+    with instrument(engine, 'task_3') as stats:
+        task_3_python_version(session)
+    print(stats.format())
+
+While a scope is active, before/after_cursor_execute listeners group the
+statements issued on the engine by normalized SQL and record how often they
+ran, their total & p95 latency and the rows fetched from them. Statements
+repeated many times within one scope are reported as likely N+1 patterns
+(typically lazy loads in a loop). The listeners only exist inside the
+scope, so instrumentation costs nothing when disabled.
+"""
+import math
+import re
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# a statement running at least this many times in one scope is an N+1 suspect
+N_PLUS_ONE_THRESHOLD = 10
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+def normalize_sql(statement):
+    """
+    Returns <statement> with literals replaced by ? and IN lists collapsed,
+    so executions differing only by their values group together
+    """
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _IN_LIST.sub('(?...)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank <fraction> percentile of <values>
+    """
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(fraction * len(ordered))) - 1)]
+
+
+class StatementStats(object):
+    """
+    Executions of one normalized statement
+    """
+    __slots__ = ('sql', 'durations', 'rows')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.durations = []
+        self.rows = 0
+
+    @property
+    def count(self):
+        return len(self.durations)
+
+    @property
+    def total(self):
+        return sum(self.durations)
+
+    @property
+    def p95(self):
+        return percentile(self.durations, 0.95) if self.durations else 0.0
+
+
+class CountingCursor(object):
+    """
+    Proxy of a DBAPI <cursor> adding the rows fetched through it to <stats>.
+    It only wraps the cursor of one result, the connection's cursors and
+    row factory are left alone.
+    """
+    __slots__ = ('cursor', 'stats')
+
+    def __init__(self, cursor, stats):
+        self.cursor = cursor
+        self.stats = stats
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.stats.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self.cursor.fetchmany(*args)
+        self.stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class ScopeStats(object):
+    """
+    Statement stats collected on <engine> while the scope <name> is active.
+    Statements from every connection of the engine are recorded, so run
+    one scope at a time per engine.
+    """
+
+    def __init__(self, engine, name, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+        self.engine = engine
+        self.name = name
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.statements = {}
+        self.seconds = 0.0
+        self._started = None
+
+    @property
+    def statement_count(self):
+        return sum(s.count for s in self.statements.values())
+
+    @property
+    def row_count(self):
+        return sum(s.rows for s in self.statements.values())
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        key = normalize_sql(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = StatementStats(key)
+        conn.info.setdefault('instrumentation_start', []).append(
+            (cursor, stats, time.perf_counter()))
+
+    def _pop_start(self, conn, cursor):
+        # the entry pushed for <cursor> by _before_cursor_execute, if any
+        starts = conn.info.get('instrumentation_start')
+        if not starts or starts[-1][0] is not cursor:
+            return None
+        _, stats, start = starts.pop()
+        stats.durations.append(time.perf_counter() - start)
+        return stats
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        stats = self._pop_start(conn, cursor)
+        if stats is not None and context is not None and context.cursor is cursor:
+            # the result about to be built from the context fetches through it
+            context.cursor = CountingCursor(cursor, stats)
+
+    def _handle_error(self, exception_context):
+        # a failed statement never reaches after_cursor_execute, its start
+        # would otherwise be popped by the next statement of the connection
+        if exception_context.connection is not None:
+            self._pop_start(exception_context.connection, exception_context.cursor)
+
+    def start(self):
+        event.listen(self.engine, 'before_cursor_execute',
+                     self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute',
+                     self._after_cursor_execute)
+        event.listen(self.engine, 'handle_error', self._handle_error)
+        self._started = time.perf_counter()
+
+    def stop(self):
+        event.remove(self.engine, 'before_cursor_execute',
+                     self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute',
+                     self._after_cursor_execute)
+        event.remove(self.engine, 'handle_error', self._handle_error)
+        self.seconds += time.perf_counter() - self._started
+
+    def ranked(self):
+        """
+        Returns the StatementStats ordered by total time, slowest first
+        """
+        return sorted(self.statements.values(), key=lambda s: s.total,
+                      reverse=True)
+
+    def n_plus_one_suspects(self):
+        """
+        Returns the SELECTs repeated at least n_plus_one_threshold times
+        """
+        return [s for s in self.ranked()
+                if s.count >= self.n_plus_one_threshold and
+                s.sql.upper().startswith('SELECT')]
+
+    def as_dict(self):
+        return {
+            'scope': self.name,
+            'seconds': self.seconds,
+            'statements': self.statement_count,
+            'rows': self.row_count,
+            'by_statement': [{'sql': s.sql, 'count': s.count, 'total': s.total,
+                              'p95': s.p95, 'rows': s.rows}
+                             for s in self.ranked()],
+            'n_plus_one': [s.sql for s in self.n_plus_one_suspects()],
+        }
+
+    def format(self, top=5, sql_width=70):
+        """
+        Returns a printable summary of the <top> slowest statements and the
+        N+1 suspects
+        """
+        lines = ['> %s: %d statements, %d rows, %0.1f ms' % (
+            self.name, self.statement_count, self.row_count, self.seconds * 1000)]
+        for s in self.ranked()[:top]:
+            lines.append('  %5dx total %8.2f ms  p95 %7.2f ms  %7d rows  %s' % (
+                s.count, s.total * 1000, s.p95 * 1000, s.rows, s.sql[:sql_width]))
+        for s in self.n_plus_one_suspects():
+            lines.append('  ! likely N+1: %d executions of %s' % (
+                s.count, s.sql[:sql_width]))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def instrument(engine, name='report', n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+    """
+    Context manager recording the statements issued on <engine> while it is
+    active, yields the ScopeStats
+    """
+    stats = ScopeStats(engine, name, n_plus_one_threshold)
+    stats.start()
+    try:
+        yield stats
+    finally:
+        stats.stop()
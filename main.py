@@ -1,14 +1,33 @@
+import argparse
+import heapq
 import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 # import numpy
 # import scipy
 # import pandas
 from sqlalchemy import Date, Integer, String, ForeignKey
-from sqlalchemy import create_engine, Table, Column, MetaData, select, text, func
+from sqlalchemy import create_engine, Table, Column, MetaData, select, text, func, inspect
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref, mapper, sessionmaker, joinedload
 from decimal import Decimal
 
+import data_quality
+import hierarchy
+import money
+import ranking
+import report_cache
+import schema_cache
+import track_sales
+from addresses import AddressRegistry, address_select, iter_address_chunks, \
+    CUSTOMER_ADDRESS_COLUMNS, INVOICE_ADDRESS_COLUMNS
+from engine_profile import PROFILES, create_profiled_engine, file_pragmas
+from instrumentation import instrument
+from relationships import CollectionView, count_related
+from report_session import plain_rows, read_only_session
+
 # ########################################################################
 # ################### DOCUMENTATION LINKs ################################
 # ########################################################################
@@ -29,9 +48,19 @@ https://docs.python.org/3/library/index.html
 
 # db path & name
 dbPath = 'database.sqlite'
-# creates engine, set echo to True for debug log
-engine = create_engine('sqlite:///%s' % dbPath, echo=False)
-Base = declarative_base(engine)
+# SQLite tuning profile applied on connect (see engine_profile.PROFILES),
+# 'report' suits workers that only read
+engineProfile = 'default'
+# set to True to print per task statement stats & likely N+1 query patterns
+instrumentQueries = False
+# set to a report_cache.ReportCache to serve reports of an unchanged db
+# without querying it (see run_report)
+reportCache = None
+
+# engine, Base, the mapped classes & the session are created by setup() (see
+# below), importing this module doesn't touch the database
+engine = None
+Base = None
 
 
 def loadSession():
@@ -112,26 +141,57 @@ class Customers(Base):
 '''
 # CODE HERE AND MODIFY ABOVE IF NEEDED
 
-# automap all existing db tables
-Base = automap_base(Base)
-Base.prepare(engine, reflect=True)
-
-# some more convenient class names than Base.classes.*
-Artists = Base.classes.Artist
-Albums = Base.classes.Album
-Customers = Base.classes.Customer
-Employees = Base.classes.Employee
-Invoices = Base.classes.Invoice
-InvoiceLines = Base.classes.InvoiceLine
-Tracks = Base.classes.Track
-Playlists = Base.classes.Playlist
+# some more convenient class names than Base.classes.*, set by setup()
+Artists = Albums = Customers = Employees = None
+Invoices = InvoiceLines = Tracks = Playlists = None
 
 # ########################################################################
 # ########################### DB SESSION #################################
 # ########################################################################
 
-# Metadata in loadSession is generated from declative base that the mapped objects use.
-session = loadSession()
+session = None
+
+
+def setup(db_path=None, profile=None):
+    """
+    Creates the engine for the sqlite database located in <db_path>
+    (default <dbPath>) using the tuning <profile> (default <engineProfile>),
+    automaps the Chinook tables and opens the module level session
+    """
+    global dbPath, engineProfile, engine, Base, session
+    global Artists, Albums, Customers, Employees, Invoices, InvoiceLines, \
+        Tracks, Playlists
+    if db_path is not None:
+        dbPath = db_path
+    if profile is not None:
+        engineProfile = profile
+
+    # creates engine, set echo to True for debug log (or see instrumentQueries)
+    engine = create_profiled_engine(dbPath, engineProfile, echo=False)
+    # reflected tables, read from the snapshot next to the db unless the
+    # db schema changed since it was written (see schema_cache.py), limited
+    # to the catalogue so installed rollups & search indexes stay unmapped
+    metadata = schema_cache.load_metadata(engine, schema_cache.default_cache_path(dbPath),
+                                          only=schema_cache.CHINOOK_TABLES)
+    # prices & totals are loaded as integer cents (see money.py)
+    money.apply_money_type(metadata)
+
+    # automap all existing db tables (already reflected into the metadata)
+    Base = automap_base(declarative_base(engine, metadata=metadata))
+    Base.prepare()
+
+    Artists = Base.classes.Artist
+    Albums = Base.classes.Album
+    Customers = Base.classes.Customer
+    Employees = Base.classes.Employee
+    Invoices = Base.classes.Invoice
+    InvoiceLines = Base.classes.InvoiceLine
+    Tracks = Base.classes.Track
+    Playlists = Base.classes.Playlist
+
+    # Metadata in loadSession is generated from declative base that the mapped objects use.
+    session = loadSession()
+    return session
 
 # ########################################################################
 # ########################## TASK ZERO ###################################
@@ -146,7 +206,6 @@ Read SQLAlchemy documenation and create python classes that are mapped to databa
 # ########################## TASK ONE ####################################
 # ########################################################################
 
-print("\n\t########### \n\t# TASK 1  #\n\t###########\n")
 """
 Task 1: 
 Verify data is correctly mapped / queried by using the count_mapped_objects
@@ -154,75 +213,93 @@ function.
 """
 
 
-def count_mapped_objects(class_name, verbose=False, limit=None):
-    # get results
-    result = session.query(class_name).all()
+def count_rows(session, class_name):
+    # computed by the db instead of loading every row
+    return session.query(func.count()).select_from(class_name).scalar()
+
+
+def count_mapped_objects(session, class_name, verbose=False, limit=None, batch_size=1000):
+    # get count
+    count = count_rows(session, class_name)
     # print count / length
-    print("> Queried %s number of rows from %s" % (len(result),
+    print("> Queried %s number of rows from %s" % (count,
                                                    str(class_name.__name__)))
     # print rows in results if verbose is true
     if verbose:
-        for i, row in enumerate(result):
-            fields = {}
-            # get relevent fields and ignore internal fields
-            for k, v in row.__dict__.items():
-                if k.startswith('_'):
-                    continue
-                fields[k] = v
-            # stop if limit is set to a number
-            if limit is not None and i >= limit:
-                break
+        # relevent fields come from the mapper, internal fields never show up
+        attrs = inspect(class_name).column_attrs
+        keys = [c.key for c in attrs]
+        # prices & totals load as cents, shown as Decimals (see money.py)
+        columns = [c.columns[0] for c in attrs]
+        query = session.query(*[getattr(class_name, k) for k in keys])
+        # stop if limit is set to a number
+        if limit is not None:
+            query = query.limit(limit)
+        # stream plain column rows in batches, nothing lands in the session
+        for i, row in enumerate(query.yield_per(batch_size)):
+            fields = {key: money.display_value(column, value)
+                      for key, column, value in zip(keys, columns, row)}
             print(">>> Row", i + 1, fields)
+    return count
 
 
-# count_mapped_objects(Artists, verbose=True, limit=2)
-# count_mapped_objects(Albums)
-# count_mapped_objects(Customers)
+# count_mapped_objects(session, Artists, verbose=True, limit=2)
+# count_mapped_objects(session, Albums)
+# count_mapped_objects(session, Customers)
 
 # CODE HERE
-# ignore warning 'Dialect sqlite+pysqlite doesn't support Decimal objects...'
-# that's okay for our purposes.
-import warnings
-warnings.filterwarnings('ignore')
-for cls in Base.classes:
-    count_mapped_objects(cls)
-warnings.filterwarnings('default')
+def mapped_object_counts(session):
+    return {cls.__name__: count_rows(session, cls) for cls in Base.classes}
+
+
+def run_task_1(session):
+    print("\n\t########### \n\t# TASK 1  #\n\t###########\n")
+    for cls in Base.classes:
+        count_mapped_objects(session, cls)
 
 # ########################################################################
 # ############################### TASK TWO ###############################
 # ########################################################################
 
-print("\n\t########### \n\t# TASK 2  #\n\t###########\n")
 """
 Task 2:
 Cross check by validating with raw SQL query (see below).
 """
 
 
-def check_count(table_name):
+def count_table(session, table_name):
     # sql query
     query = 'SELECT Count(*) FROM %s' % table_name
     # execute query
-    result = session.execute(text(query))
+    return session.execute(text(query)).scalar()
+
+
+def check_count(session, table_name):
     # print results
-    for row in result:
-        print('> Counted %s number of rows in %s' % (row[0], table_name))
+    print('> Counted %s number of rows in %s' % (count_table(session, table_name),
+                                                 table_name))
 
 
-# check_count('artist')
-# check_count('album')
-# check_count('customer')
+# check_count(session, 'artist')
+# check_count(session, 'album')
+# check_count(session, 'customer')
 
 # CODE HERE
-for cls in Base.classes:
-    table_name = cls.__table__.name
-    check_count(table_name)
+def table_counts(session):
+    return {cls.__table__.name: count_table(session, cls.__table__.name)
+            for cls in Base.classes}
+
+
+def run_task_2(session):
+    print("\n\t########### \n\t# TASK 2  #\n\t###########\n")
+    for cls in Base.classes:
+        table_name = cls.__table__.name
+        check_count(session, table_name)
 
 # ########################################################################
 # ############################### TASK THREE #############################
 # ########################################################################
 
-print("\n\t########### \n\t# TASK 3  #\n\t###########\n")
 """
 Task 3:
 Count the number of albums each artist / group has released using 
@@ -230,7 +307,7 @@ the python and sqlalchemy and print the top 5 (name, number of albums)
 """
 
 
-def task_3_sql_version():
+def task_3_sql_version(session):
     # WRITE THE QUERY
     query = "select artist.name, count(*) from artist " \
             "inner join album on album.artistid = artist.artistid " \
@@ -242,123 +319,51 @@ def task_3_sql_version():
     else:
         result = []
 
-    print("> Top 5 artists with most albums (SQL)")
-    # PRINT RESULTS
-    for row in result:
-        print(row)
+    return [tuple(row) for row in result]
 
 
-def task_3_python_version():
-    artists = session.query(Artists).all()  # all artists
-    # albums = session.query(Albums).all()  # not needed, albums loaded via artist relationship
+def task_3_python_version(session):
+    # all artists, as plain untracked rows (see report_session.py)
+    artists = list(plain_rows(session, Artists, 'ArtistId', 'Name'))
+    # album counts for all artists in one grouped query instead of a lazy
+    # album_collection load per artist (see relationships.py)
+    album_counts = count_related(session, Artists.album_collection,
+                                 [artist.ArtistId for artist in artists])
 
-    print("> Top 5 artists with most albums (Python)")
     # CODE HERE
-    lst = []  # list of tuples: (artist_name, album_count)
-    for artist in artists:
-        lst.append((artist.Name, len(artist.album_collection)))
-    lst.sort(reverse=True, key=lambda t: t[1])
+    # list of tuples: (artist_name, album_count), only the top 5 are kept
+    return heapq.nlargest(5, ((artist.Name, album_counts[artist.ArtistId])
+                              for artist in artists), key=lambda t: t[1])
 
-    # PRINT RESULTS
-    for i in range(5):
-        print(lst[i])
 
+def run_task_3(session):
+    print("\n\t########### \n\t# TASK 3  #\n\t###########\n")
+    print("> Top 5 artists with most albums (SQL)")
+    # PRINT RESULTS
+    for row in task_3_sql_version(session):
+        print(row)
 
-task_3_sql_version()
-task_3_python_version()
+    print("> Top 5 artists with most albums (Python)")
+    # PRINT RESULTS
+    for row in task_3_python_version(session):
+        print(row)
 
 # ########################################################################
 # ############################# TASK FOUR ################################
 # ########################################################################
 
-print("\n\t########### \n\t# TASK 4  #\n\t###########\n")
-
 
-class Country(object):
-    """
-  name      -> Name of country
-  """
-    # CODE HERE
-    _countries = {}  # dict of country_name : Country instance
-
-    # override __new__ to return an existing Country instance if available
-    # (to avoid duplicates)
-    def __new__(cls, country):
-        if country in Country._countries:
-            return Country._countries[country]
-        else:
-            return super(Country, cls).__new__(cls)
 
-    def __init__(self, country):
-        self.name = country
-        if country not in Country._countries:
-            Country._countries[country] = self
-
-
-class State(object):
-    """
-  name      -> Name of state
-  country   -> Country object
-  """
-    # CODE HERE
-    _states = {}  # dict of state_name : State instance
-
-    # override __new__ to return an existing State instance if available
-    # (to avoid duplicates)
-    def __new__(cls, state, country):
-        # insure unique dict key for missing state by concatenating country
-        state = state if state else '<missing>' + str(country)
-        if state in State._states:
-            return State._states[state]
-        else:
-            return super(State, cls).__new__(cls)
-
-    def __init__(self, state, country):
-        state = state if state else '<missing>' + str(country)
-        self.name = state
-        if state not in State._states:
-            State._states[state] = self
-        self.country = Country(country)
-
-
-class Locality(object):
-    """
-  name      -> Name of locality
-  zip_code  -> Zip code
-  state     -> State object
-  """
-    # CODE HERE
-    _localities = {}  # dict of locality_name : Locality instance
-
-    # override __new__ to return an existing Locality instance if available
-    # (to avoid duplicates)
-    def __new__(cls, city, zip_code, state, country):
-        # insure unique dict key for missing city by concatenating state
-        city = city if city else '<missing>' + str(state)
-        if city in Locality._localities:
-            return Locality._localities[city]
-        else:
-            return super(Locality, cls).__new__(cls)
-
-    def __init__(self, city, zip_code, state, country):
-        city = city if city else '<missing>' + str(state)
-        self.name = city
-        if city not in Locality._localities:
-            Locality._localities[city] = self
-        self.zip_code = zip_code
-        self.state = State(state, country)
-
-
-class Address(object):
-    """
-  name      -> Street address
-  locality  -> Locality object
-  """
-
-    # CODE HERE
-    def __init__(self, street, city, zip_code, state, country):
-        self.name = street
-        self.locality = Locality(city, zip_code, state, country)
+# Country, State, Locality & Address are defined in addresses.py. Instances
+# are interned by an AddressRegistry keyed on all components, so e.g. only
+# 1 country object exists for USA and same named cities never merge.
+def address_registry(session):
+    # one registry per session, released with it rather than growing for the
+    # life of the process
+    registry = session.info.get('address_registry')
+    if registry is None:
+        registry = session.info['address_registry'] = AddressRegistry()
+    return registry
 
 
 """
@@ -392,47 +397,58 @@ missing_addresses = []
 
 # CODE HERE
 
-def extract_addresses_from_customers(all_addresses, missing_addresses):
-    customers = session.query(Customers).all()  # all customers
-    for row in customers:
-        missing_data_flag = True if (None in (row.Address,
-                                              row.City,
-                                              row.PostalCode,
-                                              row.State,
-                                              row.Country)) else False
-        addr = Address(row.Address, row.City, row.PostalCode, row.State, row.Country)
-        all_addresses.append(addr)
-        if missing_data_flag: missing_addresses.append(addr)
+def extract_addresses(session, selects, all_addresses, missing_addresses):
+    # only the address columns are queried, missing data is flagged by the db
+    for addresses, missing in iter_address_chunks(session, address_registry(session),
+                                                  selects):
+        all_addresses.extend(addresses)
+        missing_addresses.extend(missing)
     return ((all_addresses, missing_addresses))
 
 
-def extract_addresses_from_invoices(all_addresses, missing_addresses):
-    invoices = session.query(Invoices).all()  # all invoices
-    for row in invoices:
-        missing_data_flag = True if (None in (row.BillingAddress,
-                                              row.BillingCity,
-                                              row.BillingPostalCode,
-                                              row.BillingState,
-                                              row.BillingCountry)) else False
-        addr = Address(row.BillingAddress,
-                       row.BillingCity,
-                       row.BillingPostalCode,
-                       row.BillingState,
-                       row.BillingCountry)
-        all_addresses.append(addr)
-        if missing_data_flag: missing_addresses.append(addr)
-    return ((all_addresses, missing_addresses))
+def extract_addresses_from_customers(session, all_addresses, missing_addresses):
+    selects = [address_select(Customers, CUSTOMER_ADDRESS_COLUMNS)]
+    return extract_addresses(session, selects, all_addresses, missing_addresses)
+
+
+def extract_addresses_from_invoices(session, all_addresses, missing_addresses):
+    selects = [address_select(Invoices, INVOICE_ADDRESS_COLUMNS)]
+    return extract_addresses(session, selects, all_addresses, missing_addresses)
+
+
+def count_distinct_addresses(session):
+    # invoices mostly repeat their customer's address: let the db drop duplicates
+    # and count the distinct addresses chunk by chunk without keeping them
+    distinct_selects = [address_select(Customers, CUSTOMER_ADDRESS_COLUMNS),
+                        address_select(Invoices, INVOICE_ADDRESS_COLUMNS)]
+    return sum(len(addresses) for addresses, _ in
+               iter_address_chunks(session, AddressRegistry(),
+                                   distinct_selects, distinct=True))
+
 
-all_addresses, missing_addresses = extract_addresses_from_customers(all_addresses, missing_addresses)
-all_addresses, missing_addresses = extract_addresses_from_invoices(all_addresses, missing_addresses)
+def address_counts(session):
+    all_addresses, missing_addresses = [], []
+    extract_addresses_from_customers(session, all_addresses, missing_addresses)
+    extract_addresses_from_invoices(session, all_addresses, missing_addresses)
+    return {'all_addresses': len(all_addresses),
+            'missing_addresses': len(missing_addresses),
+            'distinct_addresses': count_distinct_addresses(session)}
 
-print("all_addresses length is: %d" % len(all_addresses))
+
+def run_task_4(session):
+    print("\n\t########### \n\t# TASK 4  #\n\t###########\n")
+    # fills the module level lists above
+    extract_addresses_from_customers(session, all_addresses, missing_addresses)
+    extract_addresses_from_invoices(session, all_addresses, missing_addresses)
+
+    print("all_addresses length is: %d" % len(all_addresses))
+    print("distinct addresses across customers & invoices: %d" %
+          count_distinct_addresses(session))
 
 # ########################################################################
 # ################################ TASK FIVE #############################
 # ########################################################################
 
-print("\n\t########### \n\t# TASK 5  #\n\t###########\n")
 """
 Task 5:
 Using the addresses gathered in Task 4 or by running new queries, create a new function
@@ -443,64 +459,92 @@ be a zip code, state, or country. Please print out the count.
 # missing_addresses = [] moved to above & populated during task 4
 
 # CODE HERE (see task 4)
-print("missing_addresses length is %d" % len(missing_addresses))
+def missing_address_components(session):
+    # the same audit done by the db: NULL / empty counts per address component
+    # (see data_quality.py), offending keys are only fetched on demand
+    address_sources = [('Customer', Customers, CUSTOMER_ADDRESS_COLUMNS),
+                       ('Invoice', Invoices, INVOICE_ADDRESS_COLUMNS)]
+    return data_quality.missing_component_counts(session, address_sources)
+
+
+def run_task_5(session):
+    print("\n\t########### \n\t# TASK 5  #\n\t###########\n")
+    print("missing_addresses length is %d" % len(missing_addresses))
+    for source, counts in missing_address_components(session).items():
+        print("> %s: %d of %d addresses incomplete, missing %s" % (
+            source, counts['incomplete'], counts['rows'],
+            ', '.join('%s=%d' % (c, counts[c]) for c in data_quality.ADDRESS_COMPONENTS)))
+    first_page = next(data_quality.iter_incomplete_keys(session, Customers,
+                                                        CUSTOMER_ADDRESS_COLUMNS,
+                                                        component='zip_code'), [])
+    print("> Customers missing a zip code: %s" % first_page)
 
 # ########################################################################
 # ################################ TASK SIX ##############################
 # ########################################################################
 
-print("\n\t########### \n\t# TASK 6  #\n\t###########\n")
 """
 Task 6:
 Similar to Task 3, using raw sql queries and sqlalchemy, create two function that obtain the most (top 5) succesful albums in terms of highest sales. 
 """
 
 
-def task_6_sql_version():
+def task_6_sql_version(session):
     query = "select a.title, sum(i.unitprice) from InvoiceLine i " \
             "inner join Track t on t.trackid = i.trackid " \
             "inner join Album a on a.albumid = t.albumid " \
             "group by a.title " \
-            "order by sum(i.unitprice) desc limit 5 "
+            "order by sum(cast(round(i.unitprice * 100) as integer)) desc, " \
+            "a.title limit 5 "
 
     if query:
         result = session.execute(text(query))
     else:
         result = []
 
-    print("> Top 5 albums with most sales (SQL)")
-    # PRINT RESULTS
-    for row in result:
-        print(row[0], "%0.2f" % row[1])
+    return [(title, Decimal("%0.2f" % sales)) for title, sales in result]
 
-def task_6_python_version():
-    # load albums & related collections
-    albums = session.query(Albums).\
-        options(joinedload(Albums.track_collection).
-                joinedload(Tracks.invoiceline_collection)).all()
+def task_6_python_version(session):
+    # load albums, tracks & invoice lines as plain rows instead of tracked
+    # Album -> Track -> InvoiceLine instances (see report_session.py)
+    album_tracks = {}
+    for track in plain_rows(session, Tracks, 'TrackId', 'AlbumId'):
+        album_tracks.setdefault(track.AlbumId, []).append(track.TrackId)
+    track_totals = {}
+    for item in plain_rows(session, InvoiceLines, 'TrackId', 'UnitPrice'):
+        # UnitPrice is in integer cents (see money.py), plain int additions
+        track_totals[item.TrackId] = track_totals.get(item.TrackId, 0) + item.UnitPrice
 
-    print("> Top 5 albums with most sales (Python)")
     # CODE HERE
-    album_sales = []
-    for album in albums:
-        sales = Decimal(0)
-        #for track in album.track_collection:
-        tracks = album.track_collection
-        for track in tracks:
-            #for item in track.invoiceline_collection:
-            items = track.invoiceline_collection
-            for item in items:
-                sales += item.UnitPrice
-        album_sales.append((album.Title, sales))
-    album_sales.sort(reverse=True, key=lambda t: t[1])
-
-    # PRINT RESULTS
-    for i in range(5):
-        print(album_sales[i][0], album_sales[i][1])
-
-
-task_6_sql_version()
-task_6_python_version()
+    # albums sharing a title are summed together, like the SQL version
+    title_sales = {}
+    for album in plain_rows(session, Albums, 'AlbumId', 'Title'):
+        sales = title_sales.get(album.Title, 0)
+        for track_id in album_tracks.get(album.AlbumId, ()):
+            sales += track_totals.get(track_id, 0)
+        title_sales[album.Title] = sales
+    # equal sales are ranked by title, as in every backend
+    album_sales = sorted(title_sales.items(), key=lambda t: (-t[1], t[0]))
+    return [(title, money.cents_to_decimal(sales)) for title, sales in album_sales[:5]]
+
+
+def task_6_pandas_version(session):
+    # pandas & NumPy take longer to import than every other report needs to
+    # run, so they're only loaded by the first pandas report
+    import analytics
+    # columnar frames & vectorized groupby instead of ORM objects (see analytics.py)
+    return analytics.top_albums_by_sales(session, Base.metadata, n=5)
+
+
+def run_task_6(session):
+    print("\n\t########### \n\t# TASK 6  #\n\t###########\n")
+    for label, report in (('SQL', task_6_sql_version),
+                          ('Python', task_6_python_version),
+                          ('pandas', task_6_pandas_version)):
+        print("> Top 5 albums with most sales (%s)" % label)
+        # PRINT RESULTS
+        for title, sales in report(session):
+            print(title, sales)
 
 # CODE HERE
 
@@ -508,7 +552,6 @@ task_6_python_version()
 # ################################ TASK SEVEN ############################
 # ########################################################################
 
-print("\n\t########### \n\t# TASK 7  #\n\t###########\n")
 """
 Task 7:
 If possible, create a dictionary (hashmap) of artists with their tracks and number of sales count.
@@ -523,32 +566,25 @@ artist_top_tracks['Tan Vampire']['Digital Rot'] = 5 # adds song and sets count
 
 
 # CODE HERE
-def build_artist_top_tracks_dict():
-    artists = session.query(Artists).\
-            options(joinedload(Artists.album_collection).
-                 joinedload(Albums.track_collection).
-                 joinedload(Tracks.invoiceline_collection)).all()  # all artists & relationships
-    artist_top_tracks = {}
-    for artist in artists:
-        artist_top_tracks[artist.Name] = {}
-        for album in artist.album_collection:
-            for track in album.track_collection:
-                artist_top_tracks[artist.Name][track.Name] = len(track.invoiceline_collection)
-    return artist_top_tracks
-
-
-artist_top_tracks = build_artist_top_tracks_dict()
-print("number of items in artist_top_tracks is %d" % len(artist_top_tracks))
-print("the first 5 items are:")
-for i, (k, v) in enumerate(artist_top_tracks.items()):
-    if i > 4: break
-    print(k, '\n', v, '\n')
+def build_artist_top_tracks_dict(session):
+    # one query over the TrackSales rollup (kept current by triggers, see
+    # track_sales.py), or over InvoiceLine counts if it isn't installed
+    return track_sales.artist_track_sales(session)
+
+
+def run_task_7(session):
+    print("\n\t########### \n\t# TASK 7  #\n\t###########\n")
+    artist_top_tracks = build_artist_top_tracks_dict(session)
+    print("number of items in artist_top_tracks is %d" % len(artist_top_tracks))
+    print("the first 5 items are:")
+    for i, (k, v) in enumerate(artist_top_tracks.items()):
+        if i > 4: break
+        print(k, '\n', v, '\n')
 
 ########################################################################
 # ################################ TASK EIGHT ############################
 # ########################################################################
 
-print("\n\t########### \n\t# TASK 8  #\n\t###########\n")
 """
 Task 8:
 Explore PlaylistTrack many-to-many relationship by counting tracks per playlist.
@@ -559,18 +595,35 @@ Explore PlaylistTrack many-to-many relationship by counting tracks per playlist.
 # automap to count the tracks in each playlist...
 
 # CODE HERE
-print("Explore PlaylistTrack many-to-many relationship by counting tracks per playlist.")
-print('> The first five playlists & their track counts.')
-playlists = session.query(Playlists).all()
-for i, playlist in enumerate(playlists):
-    if i > 4: break
-    print('playlist ', playlist.Name, ' has ', len(playlist.track_collection), ' tracks.')
+def count_playlist_tracks(session):
+    playlists = list(plain_rows(session, Playlists, 'PlaylistId', 'Name'))
+    # track counts of all playlists in one grouped query on PlaylistTrack,
+    # no Track rows are loaded (see relationships.py)
+    track_counts = count_related(session, Playlists.track_collection,
+                                 [p.PlaylistId for p in playlists])
+    # list of tuples: (playlist_id, playlist_name, track_count)
+    return [(p.PlaylistId, p.Name, track_counts[p.PlaylistId]) for p in playlists]
+
+
+def run_task_8(session):
+    print("\n\t########### \n\t# TASK 8  #\n\t###########\n")
+    print("Explore PlaylistTrack many-to-many relationship by counting tracks per playlist.")
+    print('> The first five playlists & their track counts.')
+    playlist_counts = count_playlist_tracks(session)
+    for playlist_id, name, count in playlist_counts[:5]:
+        print('playlist ', name, ' has ', count, ' tracks.')
+
+    # big playlists are browsed a page at a time instead of loading the collection
+    playlist_id, name, _ = max(playlist_counts, key=lambda p: p[2])
+    tracks = CollectionView(session, Playlists.track_collection, playlist_id)
+    print('> First tracks of playlist %s (%d tracks):' % (name, len(tracks)))
+    for track in tracks.slice(offset=0, limit=3):
+        print('  ', track.Name)
 
 # ########################################################################
 # ################################ FINAL TASK ############################
 # ########################################################################
 
-print("\n\t########### \n\t# THANKS  #\n\t###########\n")
 """
 Task 9:
 Add any comments below related to the project, this can include feedback, questions, or anything else. Thanks for taking the time to complete this. 
@@ -582,3 +635,144 @@ As a SQLAlchemy rookie, I spent most of my time perusing the online doc.
 Hopefully using reflection/automap wasn't "cheating" on task 0 !
 
 '''
+
+
+# ########################################################################
+# ################################ RUN ALL TASKS #########################
+# ########################################################################
+
+def run_all_tasks():
+    # every task gets its own short-lived read-only session, so nothing loaded
+    # by one task is kept alive by the next ones (see report_session.py)
+    for run_task in (run_task_1, run_task_2, run_task_3, run_task_4,
+                     run_task_5, run_task_6, run_task_7, run_task_8):
+        with read_only_session(engine) as session:
+            if not instrumentQueries:
+                run_task(session)
+                continue
+            with instrument(engine, run_task.__name__) as stats:
+                run_task(session)
+        print(stats.format())
+    print("\n\t########### \n\t# THANKS  #\n\t###########\n")
+
+
+# ########################################################################
+# ################################ COMMAND LINE ##########################
+# ########################################################################
+
+# report name : function(session) returning its result, in task order
+REPORTS = {
+    'task_1_mapped_counts': mapped_object_counts,
+    'task_2_table_counts': table_counts,
+    'task_3_sql': task_3_sql_version,
+    'task_3_python': task_3_python_version,
+    'task_4_addresses': address_counts,
+    'task_5_missing_addresses': missing_address_components,
+    'task_6_sql': task_6_sql_version,
+    'task_6_python': task_6_python_version,
+    'task_6_pandas': task_6_pandas_version,
+    'task_7_artist_top_tracks': build_artist_top_tracks_dict,
+    'task_8_playlist_track_counts': count_playlist_tracks,
+    # top K per group rankings computed by window functions (see ranking.py)
+    'top_tracks_per_artist': ranking.top_tracks_per_artist,
+    'top_albums_per_genre': ranking.top_albums_per_genre,
+    # direct & downstream revenue over the ReportsTo tree (see hierarchy.py)
+    'employee_revenue_rollup': hierarchy.revenue_rollup,
+}
+
+
+def run_report(name):
+    """
+    Runs the report <name> on its own read-only session, or serves it from
+    <reportCache> when the db didn't change since it was cached, and returns
+    a dict with its name, wall time, result & whether it was cached
+    """
+    start = time.perf_counter()
+    found, result = False, None
+    if reportCache is not None:
+        # keyed & validated from the db file alone (see report_cache.py), so
+        # a hit never opens a connection
+        key = report_cache.report_key(name, dbPath)
+        token = report_cache.change_token(dbPath)
+        found, result = reportCache.get(key, token)
+    if not found:
+        with read_only_session(engine) as report_session:
+            result = REPORTS[name](report_session)
+        if reportCache is not None:
+            reportCache.put(key, token, result)
+    return {'report': name, 'seconds': time.perf_counter() - start,
+            'cached': found, 'result': result}
+
+
+def setup_reports(db_path=None, profile=None, cache_path=None):
+    """
+    setup() for run_report, results are cached in the file <cache_path>
+    when given
+    """
+    global reportCache
+    if cache_path is not None:
+        reportCache = report_cache.ReportCache(path=cache_path)
+    return setup(db_path, profile)
+
+
+def iter_report_results(names, db_path=None, profile=None, jobs=1, cache_path=None):
+    """
+    Yields the run_report dicts of the reports <names>. With <jobs> > 1 the
+    reports run in a pool of worker processes, each with its own engine &
+    session, and are yielded as they complete.
+    """
+    if jobs <= 1:
+        setup_reports(db_path, profile, cache_path)
+        for name in names:
+            yield run_report(name)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=setup_reports,
+                             initargs=(db_path, profile, cache_path)) as pool:
+        for future in as_completed([pool.submit(run_report, name) for name in names]):
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Chinook reports, all tasks as text when no report is '
+                    'given, otherwise one JSON line per report')
+    parser.add_argument('reports', nargs='*', metavar='REPORT',
+                        help="report names (see --list) or 'all'")
+    parser.add_argument('--db', default=dbPath)
+    parser.add_argument('--profile', choices=list(PROFILES), default=engineProfile,
+                        help='engine profile, note that WAL profiles switch the '
+                             'database file to WAL mode')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='worker processes running the reports')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='reuse the results cached in FILE while the db is unchanged')
+    parser.add_argument('--list', action='store_true', help='list the reports')
+    args = parser.parse_args(argv)
+    changes = file_pragmas(args.profile)
+    if changes:
+        # the db file is converted for good, with -wal / -shm files next to it
+        print('> warning: the %s profile sets %s on %s, use a copy to keep it as is' % (
+            args.profile, ', '.join('%s=%s' % change for change in changes), args.db),
+            file=sys.stderr)
+
+    if args.list:
+        for name in REPORTS:
+            print(name)
+        return 0
+    if not args.reports:
+        setup(args.db, args.profile)
+        run_all_tasks()
+        return 0
+
+    names = list(REPORTS) if args.reports == ['all'] else args.reports
+    unknown = [name for name in names if name not in REPORTS]
+    if unknown:
+        parser.error('unknown report(s): %s' % ', '.join(unknown))
+    for result in iter_report_results(names, args.db, args.profile, args.jobs,
+                                      args.cache):
+        print(json.dumps(result, default=str), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
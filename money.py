@@ -0,0 +1,92 @@
+"""
+Fixed-point money columns carried as integer cents.
+
+Chinook stores prices and totals as NUMERIC(10,2), which sqlite keeps as
+floats: every value loaded through Numeric is converted float -> Decimal
+(with a warning, pysqlite has no native Decimal) and sums add Decimals one
+at a time. The Money type makes the database return the column as exact
+integer cents instead, CAST(ROUND(UnitPrice * 100) AS INTEGER), so Python
+sums are plain int additions matching the SQL sums to the cent, and
+Decimal only appears when a value is displayed (cents_to_decimal).
+
+Money columns compare and bind in cents too, Tracks.UnitPrice == 99, or
+in units given as a Decimal: Tracks.UnitPrice == Decimal('0.99').
+"""
+from decimal import Decimal
+
+from sqlalchemy import Float, Integer, Numeric, cast, func, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+# NUMERIC columns of the Chinook schema holding amounts
+MONEY_COLUMNS = ('UnitPrice', 'Total')
+
+
+def cents(column):
+    """
+    Returns the SQL expression of the NUMERIC(10,2) <column> in integer
+    cents, whatever type the column is mapped with
+    """
+    return cast(func.round(type_coerce(column, Float) * 100), Integer)
+
+
+def decimal_to_cents(value):
+    """
+    Converts the Decimal amount <value> to integer cents, rounding half
+    to even below the cent
+    """
+    return int((value * 100).to_integral_value())
+
+
+def cents_to_decimal(value):
+    """
+    Converts integer cents to a 2 decimal places Decimal for display
+    """
+    return Decimal(int(value)).scaleb(-2)
+
+
+class Money(TypeDecorator):
+    """
+    Amount stored as NUMERIC(10,2), loaded and bound as integer cents
+    """
+    impl = Integer
+
+    def column_expression(self, column):
+        return cents(column)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, Decimal):
+            value = decimal_to_cents(value)
+        elif not isinstance(value, int):
+            raise TypeError('Money binds int cents or Decimal amounts, not %r'
+                            % type(value).__name__)
+        # sqlite keeps NUMERIC(10,2) values as REAL, so the amount is bound
+        # as the float nearest to its exact decimal value, like a stored one
+        return float(cents_to_decimal(value))
+
+    @property
+    def python_type(self):
+        return int
+
+
+def display_value(column, value):
+    """
+    Returns the <value> loaded from <column> as shown to users: the cents of
+    a Money column as a Decimal, any other value as is
+    """
+    if value is not None and isinstance(column.type, Money):
+        return cents_to_decimal(value)
+    return value
+
+
+def apply_money_type(metadata, names=MONEY_COLUMNS):
+    """
+    Switches the NUMERIC columns called <names> of every table of
+    <metadata> to Money. Must run before the tables are mapped.
+    """
+    for table in metadata.tables.values():
+        for column in table.columns:
+            if column.name in names and isinstance(column.type, Numeric):
+                column.type = Money()
+    return metadata
@@ -0,0 +1,153 @@
+"""
+Top K per group rankings computed with SQLite window functions.
+
+    top_k_per_group(session, TRACK_SALES, 'ArtistId', ('-SoldCount', 'TrackId'), k=3)
+
+numbers the rows of a source query with ROW_NUMBER() OVER (PARTITION BY
+<group> ORDER BY <order>) and keeps rank <= k, so only K rows per group
+leave the database instead of every row being fetched, sorted and sliced
+in Python. Order specs are column names, '-' prefixed for descending;
+ending them with a unique column (the child key) makes ties
+deterministic. Without a group the whole source is one partition.
+
+Sources are named queries of the per track sales (see track_sales), the
+TrackSales rollup being used when installed.
+"""
+import collections
+
+from sqlalchemy import column, func, select, text
+
+import track_sales
+
+
+class Source(collections.namedtuple('Source', 'name sql columns')):
+    """
+    A named SQL query with its result <columns>, %(sales)s standing for
+    the per track sales (see track_sales.sales_source)
+    """
+    __slots__ = ()
+
+    def selectable(self, conn):
+        sql = self.sql % {'sales': track_sales.sales_source(conn)}
+        return text(sql).columns(*[column(c) for c in self.columns]).\
+            alias(self.name)
+
+
+# every track with its sales, artists without sales still rank their tracks
+TRACK_SALES = Source('track_sales', """
+SELECT al.ArtistId, ar.Name AS Artist, t.TrackId, t.Name AS Track,
+       coalesce(s.SoldCount, 0) AS SoldCount,
+       coalesce(s.RevenueCents, 0) AS RevenueCents
+FROM Track t
+JOIN Album al ON al.AlbumId = t.AlbumId
+JOIN Artist ar ON ar.ArtistId = al.ArtistId
+LEFT JOIN %(sales)s s ON s.TrackId = t.TrackId
+""", ('ArtistId', 'Artist', 'TrackId', 'Track', 'SoldCount', 'RevenueCents'))
+
+# album revenue per genre, from the album tracks of that genre
+GENRE_ALBUM_SALES = Source('genre_album_sales', """
+SELECT t.GenreId, g.Name AS Genre, t.AlbumId, al.Title AS Album,
+       coalesce(sum(s.SoldCount), 0) AS SoldCount,
+       coalesce(sum(s.RevenueCents), 0) AS RevenueCents
+FROM Track t
+JOIN Genre g ON g.GenreId = t.GenreId
+JOIN Album al ON al.AlbumId = t.AlbumId
+LEFT JOIN %(sales)s s ON s.TrackId = t.TrackId
+GROUP BY t.GenreId, t.AlbumId
+""", ('GenreId', 'Genre', 'AlbumId', 'Album', 'SoldCount', 'RevenueCents'))
+
+# album count per artist
+ARTIST_ALBUMS = Source('artist_albums', """
+SELECT ar.ArtistId, ar.Name AS Artist, count(al.AlbumId) AS AlbumCount
+FROM Artist ar
+JOIN Album al ON al.ArtistId = ar.ArtistId
+GROUP BY ar.ArtistId
+""", ('ArtistId', 'Artist', 'AlbumCount'))
+
+# revenue per album
+ALBUM_SALES = Source('album_sales', """
+SELECT al.AlbumId, al.Title AS Album,
+       coalesce(sum(s.SoldCount), 0) AS SoldCount,
+       coalesce(sum(s.RevenueCents), 0) AS RevenueCents
+FROM Album al
+JOIN Track t ON t.AlbumId = al.AlbumId
+LEFT JOIN %(sales)s s ON s.TrackId = t.TrackId
+GROUP BY al.AlbumId
+""", ('AlbumId', 'Album', 'SoldCount', 'RevenueCents'))
+
+
+def _order_clause(source, spec):
+    if spec.startswith('-'):
+        return source.c[spec[1:]].desc()
+    return source.c[spec].asc()
+
+
+def ranked_select(source, group, order, k):
+    """
+    Returns a select of the <source> (a selectable) rows plus their 'rank'
+    within the partition of the <group> column(s), keeping rank <= <k>,
+    ordered by group & rank
+    """
+    groups = [group] if isinstance(group, str) else list(group or ())
+    partition = [source.c[name] for name in groups]
+    rank = func.row_number().over(
+        partition_by=partition or None,
+        order_by=[_order_clause(source, spec) for spec in order]).label('rank')
+    ranked = select([source, rank]).alias('ranked')
+    return select(ranked.c).where(ranked.c.rank <= k).\
+        order_by(*[ranked.c[name] for name in groups] + [ranked.c.rank])
+
+
+def top_k_per_group(session, source, group, order, k=3):
+    """
+    Returns an ordered dict of group value : list of row dicts (with their
+    'rank') of the <k> first rows of each <group> of <source> (a Source)
+    according to <order>. Without <group> the list of the <k> first rows
+    is returned.
+    """
+    conn = session.connection()
+    query = ranked_select(source.selectable(conn), group, order, k)
+    rows = [dict(row) for row in session.execute(query)]
+    if not group:
+        return rows
+    groups = collections.OrderedDict()
+    for row in rows:
+        key = row[group] if isinstance(group, str) else tuple(row[g] for g in group)
+        groups.setdefault(key, []).append(row)
+    return groups
+
+
+def top_tracks_per_artist(session, k=3, by='SoldCount'):
+    """
+    Returns {ArtistId: rows} of the <k> best selling tracks of each artist
+    by SoldCount or RevenueCents, ties going to the lower TrackId
+    """
+    return top_k_per_group(session, TRACK_SALES, 'ArtistId',
+                           ('-%s' % by, 'TrackId'), k)
+
+
+def top_albums_per_genre(session, k=3, by='RevenueCents'):
+    """
+    Returns {GenreId: rows} of the <k> best selling albums of each genre,
+    ties going to the lower AlbumId
+    """
+    return top_k_per_group(session, GENRE_ALBUM_SALES, 'GenreId',
+                           ('-%s' % by, 'AlbumId'), k)
+
+
+def top_artists_by_albums(session, k=5):
+    """
+    Returns the rows of the <k> artists with the most albums, ties going
+    to the artist name (Task 3)
+    """
+    return top_k_per_group(session, ARTIST_ALBUMS, None,
+                           ('-AlbumCount', 'Artist', 'ArtistId'), k)
+
+
+def top_albums_by_sales(session, k=5, by='RevenueCents'):
+    """
+    Returns the rows of the <k> best selling albums, ties going to the
+    lower AlbumId (Task 6 ranks album titles instead)
+    """
+    return top_k_per_group(session, ALBUM_SALES, None,
+                           ('-%s' % by, 'AlbumId'), k)
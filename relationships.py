@@ -0,0 +1,152 @@
+"""
+Batched aggregates over automapped relationships.
+
+Reading len(parent.<x>_collection) fires one lazy SELECT per parent (N+1).
+The helpers here answer the same question for many parents with one grouped
+query per chunk of parents, working directly on the foreign key columns so
+no child objects are loaded.
+
+CollectionView answers counts, membership and paged slices of a single
+parent's collection the same way, e.g. against PlaylistTrack (through
+IPK_PlaylistTrack) for Playlist.track_collection.
+"""
+from sqlalchemy import and_, func, select
+
+# SQLite allows at most 999 bound parameters per statement in older builds
+IN_CHUNK_SIZE = 500
+
+
+def _relationship_columns(relationship):
+    """
+    Returns (parent column, counted column, counted table) for <relationship>.
+    For many-to-many relationships the association table is counted.
+    """
+    prop = relationship.property
+    if prop.secondary is not None:
+        pairs = prop.synchronize_pairs
+        table = prop.secondary
+    else:
+        pairs = prop.local_remote_pairs
+        table = prop.mapper.local_table
+    if len(pairs) != 1:
+        raise ValueError('%s joins on %d columns, only single column keys '
+                         'are supported' % (relationship, len(pairs)))
+    parent_column, counted_column = pairs[0]
+    return parent_column, counted_column, table
+
+
+def _child_link_columns(relationship):
+    """
+    Returns (child key column, link column) for <relationship>: the column
+    identifying a related object and the column holding it on the counted
+    table (the association table for many-to-many relationships).
+    """
+    prop = relationship.property
+    if prop.secondary is not None:
+        return prop.secondary_synchronize_pairs[0]
+    pk = prop.mapper.primary_key
+    if len(pk) != 1:
+        raise ValueError('%s has a composite primary key, only single column '
+                         'keys are supported' % prop.mapper.class_.__name__)
+    return pk[0], pk[0]
+
+
+def _parent_value(relationship, parent_column, parent):
+    mapper = relationship.property.parent
+    if isinstance(parent, mapper.class_):
+        return getattr(parent, mapper.get_property_by_column(parent_column).key)
+    return parent
+
+
+def _chunks(values, size):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def count_related(session, relationship, parents=None, chunk_size=IN_CHUNK_SIZE):
+    """
+    Counts the objects behind <relationship> (e.g. Artists.album_collection)
+    for each parent and returns a dict of parent key : count.
+
+    <parents> may be instances or raw key values; every given parent appears
+    in the result, with 0 when it has no related rows. Without <parents>
+    a single grouped query counts all parents that have related rows.
+    """
+    parent_column, counted_column, table = _relationship_columns(relationship)
+    query = select([counted_column, func.count()]).\
+        select_from(table).\
+        group_by(counted_column)
+
+    if parents is None:
+        return dict(session.execute(query).fetchall())
+
+    keys = [_parent_value(relationship, parent_column, p) for p in parents]
+    counts = dict.fromkeys(keys, 0)
+    unique_keys = list(counts)
+    for chunk in _chunks(unique_keys, chunk_size):
+        rows = session.execute(query.where(counted_column.in_(chunk)))
+        counts.update(rows.fetchall())
+    return counts
+
+
+class CollectionView(object):
+    """
+    Read-only, count-aware view of the <relationship> collection of one
+    <parent> (instance or key value), e.g.
+        CollectionView(session, Playlists.track_collection, playlist)
+    Nothing is loaded until asked for and counts, membership tests and
+    slices are answered by the counted table's indexes.
+    """
+
+    def __init__(self, session, relationship, parent):
+        self.session = session
+        self.relationship = relationship
+        parent_column, self._counted_column, self._table = \
+            _relationship_columns(relationship)
+        self.key = _parent_value(relationship, parent_column, parent)
+        self._child_column, self._link_column = _child_link_columns(relationship)
+
+    def _where(self, *clauses):
+        return and_(self._counted_column == self.key, *clauses)
+
+    def count(self):
+        query = select([func.count()]).select_from(self._table).\
+            where(self._where())
+        return self.session.execute(query).scalar()
+
+    __len__ = count
+
+    def exists(self):
+        """
+        Returns True when the collection holds at least one object
+        """
+        query = select([1]).select_from(self._table).\
+            where(self._where()).limit(1)
+        return self.session.execute(query).first() is not None
+
+    __bool__ = exists
+
+    def __contains__(self, child):
+        """
+        Tests membership of <child> (instance or key value)
+        """
+        mapper = self.relationship.property.mapper
+        if isinstance(child, mapper.class_):
+            child = getattr(child, mapper.get_property_by_column(
+                self._child_column).key)
+        query = select([1]).select_from(self._table).\
+            where(self._where(self._link_column == child)).limit(1)
+        return self.session.execute(query).first() is not None
+
+    def slice(self, offset=0, limit=None):
+        """
+        Returns <limit> related objects starting at <offset>, ordered by
+        their key
+        """
+        prop = self.relationship.property
+        query = self.session.query(prop.mapper.class_)
+        if prop.secondary is not None:
+            query = query.join(self._table,
+                               self._link_column == self._child_column)
+        query = query.filter(self._where()).order_by(self._link_column)
+        return query.offset(offset).limit(limit).all()
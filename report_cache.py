@@ -0,0 +1,215 @@
+"""
+Memoized report results, invalidated when the database changes.
+
+Dashboards poll the same reports over and over while the data rarely
+changes. Results are kept in an LRU bounded cache keyed by report name and
+parameters, each entry remembering the change token of the database it was
+computed from:
+
+    cache = ReportCache(max_entries=64, path='reports.cache.pickle')
+    top_artists = memoize(cache)(task_3_sql_version)
+    top_artists(session)   # computed
+    top_artists(session)   # served from the cache, no query at all
+
+The token is built from os.stat() of the database file and its -wal file
+(inode, size & mtime), so checking it never touches the database. PRAGMA
+data_version would need a connection round trip and only reports commits
+made by other connections.
+
+Several processes may share one cache file (main.py --jobs): saving
+re-reads the file under an exclusive lock and merges its entries with the
+ones this process computed before atomically replacing it.
+"""
+import functools
+import os
+import pickle
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, saves are merged without a lock there
+    fcntl = None
+
+# bump when the layout of the pickled payload changes
+CACHE_FORMAT = 1
+
+MAX_ENTRIES = 128
+
+# read-only engines use uri filenames (see engine_profile.database_url)
+_URI_PREFIX = 'file:'
+
+
+def database_path(session):
+    """
+    Returns the file of the sqlite database <session> is bound to
+    """
+    path = session.get_bind().engine.url.database
+    if path.startswith(_URI_PREFIX):
+        path = path[len(_URI_PREFIX):].split('?', 1)[0]
+    return path
+
+
+def change_token(db_path):
+    """
+    Returns a token of the database file <db_path> that changes whenever
+    a write is committed to it (or to its WAL)
+    """
+    token = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            st = os.stat(path)
+        except OSError:
+            token.append(None)
+            continue
+        token.append((st.st_ino, st.st_size, st.st_mtime_ns))
+    return tuple(token)
+
+
+class ReportCache(object):
+    """
+    LRU cache of report results holding at most <max_entries>. With <path>
+    the entries are loaded from and written back to that pickle file, so
+    they survive restarts.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # keys put since the last save, which win over the file's entries
+        self._changed = set()
+        self._cleared = False
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, token):
+        """
+        Returns (True, result) when <key> was computed for the database
+        state <token>, (False, None) otherwise
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != token:
+            if entry is not None:
+                # computed from an older database state, never valid again
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, key, token, result):
+        self._entries[key] = (token, result)
+        self._entries.move_to_end(key)
+        self._changed.add(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self.path is not None:
+            self.save()
+
+    def clear(self):
+        self._entries.clear()
+        self._changed.clear()
+        self._cleared = True
+        if self.path is not None:
+            self.save()
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                cache_format, entries = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+                ImportError, ValueError):
+            return []
+        if cache_format != CACHE_FORMAT:
+            return []
+        return entries
+
+    def _load(self):
+        self._entries = OrderedDict(self._read())
+        self._trim()
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @contextmanager
+    def _lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        """
+        Writes the entries to <path>, merged with the ones other processes
+        saved there meanwhile. Entries put by this process since its last
+        save replace theirs and become the most recently used.
+        """
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with self._lock():
+                entries = OrderedDict() if self._cleared else OrderedDict(self._read())
+                for key, entry in self._entries.items():
+                    if key in self._changed:
+                        entries.pop(key, None)
+                        entries[key] = entry
+                self._entries = entries
+                self._trim()
+                # write to a temporary file first so readers never see a
+                # partially written cache
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump((CACHE_FORMAT, list(self._entries.items())), f,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
+            self._changed.clear()
+            self._cleared = False
+        except OSError:
+            # a read-only location only costs us the persistence
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def report_key(name, db_path, args=(), kwargs=None):
+    """
+    Returns the cache key of the report <name> called with <args> and
+    <kwargs> (all hashable) on the database <db_path>
+    """
+    return (name, os.path.abspath(db_path), tuple(args),
+            tuple(sorted((kwargs or {}).items())))
+
+
+def memoize(cache, name=None):
+    """
+    Decorator caching the results of a report function(session, ...) in
+    <cache>. Results must be picklable when the cache is persisted.
+    """
+    def decorator(report):
+        report_name = name or report.__name__
+
+        @functools.wraps(report)
+        def wrapper(session, *args, **kwargs):
+            db_path = database_path(session)
+            key = report_key(report_name, db_path, args, kwargs)
+            token = change_token(db_path)
+            found, result = cache.get(key, token)
+            if not found:
+                result = report(session, *args, **kwargs)
+                cache.put(key, token, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
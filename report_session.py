@@ -0,0 +1,96 @@
+"""
+Short-lived read-only sessions and plain row records for the reports.
+
+One session shared by every report keeps each instance it ever loaded in
+its identity map, so memory only grows as reports run. Reports instead get
+their own session, closed (which expunges everything) as soon as they
+return:
+
+    with read_only_session(engine) as session:
+        for track in plain_rows(session, Tracks, 'TrackId', 'Name'):
+            ...
+
+Flushing pending changes from such a session raises ReadOnlySessionError
+and its connection runs with PRAGMA query_only, so SQL writes issued with
+session.execute() fail too (sqlite3.OperationalError). plain_rows() skips
+the ORM altogether: rows come back as namedtuples, never tracked, identity
+mapped or expired, which is all a read-only report loop needs.
+"""
+import collections
+from contextlib import contextmanager
+
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session, configure_mappers
+
+CHUNK_SIZE = 1000
+
+_row_types = {}
+
+
+class ReadOnlySessionError(Exception):
+    """
+    Raised when a read-only session is asked to flush changes
+    """
+
+
+def _refuse_flush(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        raise ReadOnlySessionError('report sessions are read-only')
+
+
+@contextmanager
+def read_only_session(bind):
+    """
+    Context manager yielding a new read-only session on a connection of
+    <bind>, closed on exit so its instances & connection are released
+    """
+    connection = bind.connect()
+    # pooled connections are shared with writers, restore what they had
+    query_only = connection.execute(text('PRAGMA query_only')).scalar()
+    connection.execute(text('PRAGMA query_only = ON'))
+    session = Session(bind=connection, autoflush=False)
+    event.listen(session, 'before_flush', _refuse_flush)
+    try:
+        yield session
+    finally:
+        # also expunges every instance, the identity map dies with the report
+        session.close()
+        connection.execute(text('PRAGMA query_only = %d' % query_only))
+        connection.close()
+
+
+def row_type(mapped_class, keys):
+    """
+    Returns the namedtuple class <Class>Row with the fields <keys>
+    """
+    row_class = _row_types.get((mapped_class, keys))
+    if row_class is None:
+        row_class = _row_types[(mapped_class, keys)] = collections.namedtuple(
+            '%sRow' % mapped_class.__name__, keys)
+    return row_class
+
+
+def plain_rows(session, mapped_class, *keys, where=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields the rows of <mapped_class> (optionally filtered by the <where>
+    clause) in primary key order as namedtuples of the attributes <keys>,
+    all columns by default. Rows are fetched <chunk_size> at a time.
+    """
+    # relationships & backrefs are set up by the first ORM query, which
+    # plain rows may well precede
+    configure_mappers()
+    mapper = inspect(mapped_class)
+    keys = keys or tuple(attr.key for attr in mapper.column_attrs)
+    query = select([getattr(mapped_class, key) for key in keys]).\
+        order_by(*mapper.primary_key)
+    if where is not None:
+        query = query.where(where)
+
+    make_row = row_type(mapped_class, keys)._make
+    result = session.execute(query)
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            yield make_row(row)
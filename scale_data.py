@@ -0,0 +1,283 @@
+"""
+Synthetic Chinook-shaped database generator for load testing.
+
+Builds a new database with the exact schema of the source one, scaled by a
+factor:
+  - the catalogue (Artist, Album, Track, Playlist, PlaylistTrack), the
+    customers and the employee org chart are the source rows copied
+    <factor> times with offset keys, so album sizes, playlist contents and
+    missing (NULL) address fields keep their real shape
+  - every copy of the org chart reports to the source General Manager
+  - invoices pick customers uniformly and bill their address, invoice lines
+    pick albums with a Zipf distribution (a few best sellers, long tail)
+All rows are bulk inserted in a single transaction.
+
+usage: python scale_data.py --factor 10 [--source database.sqlite]
+                            [--output database_x10.sqlite] [--seed 1]
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import time
+
+from sqlalchemy import create_engine, text
+
+# tables of the Chinook schema, parents first
+TABLES = ('Genre', 'MediaType', 'Employee', 'Customer', 'Artist', 'Album',
+          'Track', 'Playlist', 'PlaylistTrack', 'Invoice', 'InvoiceLine')
+
+INSERT_CHUNK_SIZE = 20000
+
+# exponent of the Zipf distribution of album sales
+ALBUM_SKEW = 1.1
+
+
+def copy_schema(source_engine, target_engine):
+    """
+    Creates the Chinook tables & indexes of the source database in the
+    target one, using the original DDL
+    """
+    with source_engine.connect() as conn:
+        ddl = conn.execute(text(
+            "SELECT type, sql FROM sqlite_master "
+            "WHERE tbl_name IN (%s) AND sql IS NOT NULL AND type IN ('table', 'index') "
+            "ORDER BY type = 'index', rowid" %
+            ', '.join("'%s'" % t for t in TABLES))).fetchall()
+    with target_engine.begin() as conn:
+        for _, sql in ddl:
+            conn.execute(text(sql))
+
+
+def _rows(conn, table, order_by):
+    query = 'SELECT * FROM %s ORDER BY %s' % (table, order_by)
+    return [dict(row) for row in conn.execute(text(query))]
+
+
+def _suffix(value, copy):
+    return value if copy == 0 or value is None else '%s (%d)' % (value, copy)
+
+
+class ZipfSampler(object):
+    """
+    Samples the values of <population> with weight 1 / rank ** <skew>, the
+    ranks being assigned in a random order
+    """
+
+    def __init__(self, population, skew, rng):
+        self.population = list(population)
+        rng.shuffle(self.population)
+        weights = (1.0 / (rank ** skew)
+                   for rank in range(1, len(self.population) + 1))
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.rng = rng
+
+    def sample(self):
+        x = self.rng.random() * self.cum_weights[-1]
+        return self.population[bisect.bisect(self.cum_weights, x)]
+
+
+def generate(source_path, output_path, factor, seed=1):
+    """
+    Writes a database scaled by <factor> from <source_path> to <output_path>
+    and returns a dict of table name : row count
+    """
+    if os.path.exists(output_path):
+        raise ValueError('%s already exists' % output_path)
+    rng = random.Random(seed)
+    source = create_engine('sqlite:///%s' % source_path)
+    target = create_engine('sqlite:///%s' % output_path)
+    copy_schema(source, target)
+
+    with source.connect() as conn:
+        src = {
+            'Genre': _rows(conn, 'Genre', 'GenreId'),
+            'MediaType': _rows(conn, 'MediaType', 'MediaTypeId'),
+            'Employee': _rows(conn, 'Employee', 'EmployeeId'),
+            'Customer': _rows(conn, 'Customer', 'CustomerId'),
+            'Artist': _rows(conn, 'Artist', 'ArtistId'),
+            'Album': _rows(conn, 'Album', 'AlbumId'),
+            'Track': _rows(conn, 'Track', 'TrackId'),
+            'Playlist': _rows(conn, 'Playlist', 'PlaylistId'),
+            'PlaylistTrack': _rows(conn, 'PlaylistTrack', 'PlaylistId, TrackId'),
+            'Invoice': _rows(conn, 'Invoice', 'InvoiceId'),
+            'InvoiceLine': _rows(conn, 'InvoiceLine', 'InvoiceLineId'),
+        }
+    source.dispose()
+
+    def max_id(table, column):
+        return max(row[column] for row in src[table])
+
+    offsets = {column: max_id(table, column) for table, column in (
+        ('Employee', 'EmployeeId'), ('Customer', 'CustomerId'),
+        ('Artist', 'ArtistId'), ('Album', 'AlbumId'), ('Track', 'TrackId'),
+        ('Playlist', 'PlaylistId'))}
+    root = next(e['EmployeeId'] for e in src['Employee'] if e['ReportsTo'] is None)
+
+    def shift(value, column, copy):
+        return None if value is None else value + offsets[column] * copy
+
+    def employees():
+        for copy in range(factor):
+            for row in src['Employee']:
+                row = dict(row, EmployeeId=shift(row['EmployeeId'], 'EmployeeId', copy),
+                           Email=_suffix(row['Email'], copy))
+                if row['ReportsTo'] is None:
+                    # copies of the org chart hang below the original root
+                    row['ReportsTo'] = root if copy else None
+                else:
+                    row['ReportsTo'] = shift(row['ReportsTo'], 'EmployeeId', copy)
+                yield row
+
+    def customers():
+        for copy in range(factor):
+            for row in src['Customer']:
+                yield dict(row, CustomerId=shift(row['CustomerId'], 'CustomerId', copy),
+                           SupportRepId=shift(row['SupportRepId'], 'EmployeeId', copy),
+                           Email=_suffix(row['Email'], copy))
+
+    def artists():
+        for copy in range(factor):
+            for row in src['Artist']:
+                yield dict(row, ArtistId=shift(row['ArtistId'], 'ArtistId', copy),
+                           Name=_suffix(row['Name'], copy))
+
+    def albums():
+        for copy in range(factor):
+            for row in src['Album']:
+                yield dict(row, AlbumId=shift(row['AlbumId'], 'AlbumId', copy),
+                           ArtistId=shift(row['ArtistId'], 'ArtistId', copy),
+                           Title=_suffix(row['Title'], copy))
+
+    def tracks():
+        for copy in range(factor):
+            for row in src['Track']:
+                yield dict(row, TrackId=shift(row['TrackId'], 'TrackId', copy),
+                           AlbumId=shift(row['AlbumId'], 'AlbumId', copy),
+                           Name=_suffix(row['Name'], copy))
+
+    def playlists():
+        for copy in range(factor):
+            for row in src['Playlist']:
+                yield dict(row, PlaylistId=shift(row['PlaylistId'], 'PlaylistId', copy),
+                           Name=_suffix(row['Name'], copy))
+
+    def playlist_tracks():
+        for copy in range(factor):
+            for row in src['PlaylistTrack']:
+                yield {'PlaylistId': shift(row['PlaylistId'], 'PlaylistId', copy),
+                       'TrackId': shift(row['TrackId'], 'TrackId', copy)}
+
+    # sales: tracks of a Zipf-picked album, for a uniformly picked customer
+    src_album_tracks = {}
+    for row in src['Track']:
+        if row['AlbumId'] is not None:
+            src_album_tracks.setdefault(row['AlbumId'], []).\
+                append((row['TrackId'], row['UnitPrice']))
+    album_sampler = ZipfSampler(
+        [shift(album_id, 'AlbumId', copy)
+         for copy in range(factor) for album_id in sorted(src_album_tracks)],
+        ALBUM_SKEW, rng)
+    customer_rows = list(customers())
+    lines_per_invoice = {}
+    for row in src['InvoiceLine']:
+        lines_per_invoice[row['InvoiceId']] = lines_per_invoice.get(row['InvoiceId'], 0) + 1
+
+    def sale_track():
+        album_id = album_sampler.sample()
+        copy = (album_id - 1) // offsets['AlbumId']
+        track_id, unit_price = rng.choice(
+            src_album_tracks[album_id - offsets['AlbumId'] * copy])
+        return shift(track_id, 'TrackId', copy), unit_price
+
+    def sales():
+        # yields ('Invoice', row) followed by ('InvoiceLine', row) for its lines
+        invoice_id = 0
+        line_id = 0
+        for copy in range(factor):
+            for template in src['Invoice']:
+                invoice_id += 1
+                customer = rng.choice(customer_rows)
+                lines = []
+                cents = 0
+                for _ in range(lines_per_invoice.get(template['InvoiceId'], 1)):
+                    line_id += 1
+                    track_id, unit_price = sale_track()
+                    cents += int(round(unit_price * 100))
+                    lines.append({'InvoiceLineId': line_id, 'InvoiceId': invoice_id,
+                                  'TrackId': track_id, 'UnitPrice': unit_price,
+                                  'Quantity': 1})
+                yield 'Invoice', {
+                    'InvoiceId': invoice_id,
+                    'CustomerId': customer['CustomerId'],
+                    'InvoiceDate': template['InvoiceDate'],
+                    'BillingAddress': customer['Address'],
+                    'BillingCity': customer['City'],
+                    'BillingState': customer['State'],
+                    'BillingCountry': customer['Country'],
+                    'BillingPostalCode': customer['PostalCode'],
+                    'Total': cents / 100.0,
+                }
+                for line in lines:
+                    yield 'InvoiceLine', line
+
+    sources = [
+        ('Genre', src['Genre']), ('MediaType', src['MediaType']),
+        ('Employee', employees()), ('Customer', customer_rows),
+        ('Artist', artists()), ('Album', albums()), ('Track', tracks()),
+        ('Playlist', playlists()), ('PlaylistTrack', playlist_tracks()),
+        (('Invoice', 'InvoiceLine'), sales()),
+    ]
+
+    with target.begin() as conn:
+        columns = {name: [row[1] for row in conn.execute(
+            text('PRAGMA table_info(%s)' % name))] for name in TABLES}
+        inserts = {name: 'INSERT INTO %s (%s) VALUES (%s)' % (
+            name, ', '.join(columns[name]), ', '.join('?' * len(columns[name])))
+            for name in TABLES}
+        # plain DBAPI executemany of tuples inside the same transaction, the
+        # values are copied as stored so no type processing is needed
+        cursor = conn.connection.cursor()
+        # a brand new file: no need for a rollback journal while loading
+        conn.execute(text('PRAGMA journal_mode=OFF'))
+        conn.execute(text('PRAGMA synchronous=OFF'))
+        counts = dict.fromkeys(TABLES, 0)
+        for names, rows in sources:
+            if isinstance(names, str):
+                rows = ((names, row) for row in rows)
+            pending = {}
+            for name, row in rows:
+                chunk = pending.setdefault(name, [])
+                chunk.append(tuple(row[c] for c in columns[name]))
+                if len(chunk) >= INSERT_CHUNK_SIZE:
+                    cursor.executemany(inserts[name], chunk)
+                    counts[name] += len(chunk)
+                    del chunk[:]
+            for name, chunk in pending.items():
+                cursor.executemany(inserts[name], chunk)
+                counts[name] += len(chunk)
+        cursor.close()
+    target.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--factor', type=int, required=True)
+    parser.add_argument('--source', default='database.sqlite')
+    parser.add_argument('--output')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    output = args.output or 'database_x%d.sqlite' % args.factor
+
+    start = time.perf_counter()
+    counts = generate(args.source, output, args.factor, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    for name in TABLES:
+        print('> %-14s %10d rows' % (name, counts[name]))
+    print('> wrote %s in %0.1fs' % (output, elapsed))
+
+
+if __name__ == '__main__':
+    main()
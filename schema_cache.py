@@ -0,0 +1,102 @@
+"""
+Persisted schema snapshot for the automapped database.
+
+Reflecting every table (columns, keys, indexes) costs a round of PRAGMA
+queries per table on each start. The reflected MetaData is pickled next to
+the database and keyed by the schema version, so warm starts only need to
+read <cache file> and fall back to live reflection when the schema changed.
+
+Reflection can be limited to some tables, e.g. CHINOOK_TABLES, so the
+tables added by the optional installs (the TrackSales rollup, the
+TrackSearch index & its shadow tables) are never automapped.
+"""
+import hashlib
+import os
+import pickle
+
+import sqlalchemy
+from sqlalchemy import MetaData, text
+
+# bump when the layout of the pickled payload changes
+CACHE_FORMAT = 1
+
+# the tables of the Chinook catalogue itself
+CHINOOK_TABLES = ('Album', 'Artist', 'Customer', 'Employee', 'Genre', 'Invoice',
+                  'InvoiceLine', 'MediaType', 'Playlist', 'PlaylistTrack', 'Track')
+
+
+def default_cache_path(db_path):
+    """
+    Returns the snapshot file used for the database located in <db_path>
+    """
+    return '%s.schema.pickle' % db_path
+
+
+def schema_key(engine, only=None):
+    """
+    Returns a key identifying the current schema of the database, reflected
+    limited to the tables <only> when given.
+
+    PRAGMA schema_version changes on every DDL statement and the digest of
+    sqlite_master guards against a different file carrying the same version.
+    The SQLAlchemy version is part of the key since pickled tables are not
+    portable across releases.
+    """
+    with engine.connect() as conn:
+        version = conn.execute(text('PRAGMA schema_version')).scalar()
+        digest = hashlib.sha1()
+        rows = conn.execute(text('SELECT type, name, tbl_name, sql '
+                                 'FROM sqlite_master ORDER BY type, name'))
+        for row in rows:
+            digest.update(repr(tuple(row)).encode('utf-8'))
+    tables = ','.join(sorted(only)) if only is not None else '*'
+    return '%d:%d:%s:%s:%s' % (CACHE_FORMAT, version, digest.hexdigest(),
+                               sqlalchemy.__version__, tables)
+
+
+def _read_snapshot(cache_path, key):
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, metadata = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ImportError, ValueError):
+        return None
+    if cached_key != key:
+        return None
+    return metadata
+
+
+def _write_snapshot(cache_path, key, metadata):
+    # write to a temporary file first so concurrent starts never see a
+    # partially written snapshot
+    tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((key, metadata), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # a read-only location only costs us the warm start
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_metadata(engine, cache_path=None, refresh=False, only=None):
+    """
+    Returns a MetaData holding all tables of the database bound to <engine>,
+    or only the tables named in <only>.
+
+    The snapshot in <cache_path> is used when its key matches the current
+    schema, otherwise the database is reflected and the snapshot rewritten.
+    Set <refresh> to True to force live reflection.
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(engine.url.database)
+    key = schema_key(engine, only)
+
+    metadata = None if refresh else _read_snapshot(cache_path, key)
+    if metadata is None:
+        metadata = MetaData()
+        metadata.reflect(engine, only=list(only) if only is not None else None)
+        _write_snapshot(cache_path, key, metadata)
+    metadata.bind = engine
+    return metadata
@@ -0,0 +1,257 @@
+"""
+Full-text search over the catalogue names (SQLite FTS5).
+
+TrackSearch is an external-content FTS5 index with one document per track:
+its Name & Composer plus the Title of its album and the Name of its artist,
+read through the TrackSearchContent view, so no text is stored twice.
+Once installed, triggers on Track, Album and Artist keep the index in sync
+(an album or artist rename reindexes its tracks). Searches are token
+prefix matches ranked by bm25, track name hits weighing most, and return
+the owning album & artist from the same query. LIKE '%term%' has to scan
+every row instead. Albums & artists without tracks aren't indexed.
+
+usage: python search.py {install,rebuild,verify,uninstall} [--db PATH]
+       python search.py search TERM ... [--db PATH] [--limit 10]
+"""
+import argparse
+import collections
+import re
+
+from sqlalchemy import create_engine, text
+
+TABLE = 'TrackSearch'
+CONTENT_VIEW = 'TrackSearchContent'
+
+LIMIT = 10
+
+# bm25 weights of the indexed columns, in CREATE_TABLE order
+WEIGHTS = (10.0, 2.0, 5.0, 5.0)
+
+CREATE_VIEW = """
+CREATE VIEW IF NOT EXISTS [TrackSearchContent] AS
+SELECT t.TrackId, t.Name, t.Composer, al.Title AS Album, ar.Name AS Artist
+FROM Track t
+LEFT JOIN Album al ON al.AlbumId = t.AlbumId
+LEFT JOIN Artist ar ON ar.ArtistId = al.ArtistId
+"""
+
+# prefix indexes of 2 & 3 characters keep short prefix queries fast
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS [TrackSearch] USING fts5(
+    Name, Composer, Album, Artist,
+    content='TrackSearchContent', content_rowid='TrackId',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+)
+"""
+
+# (re)index the tracks selected by <where> from the content view
+_INDEX = """
+    INSERT INTO TrackSearch (rowid, Name, Composer, Album, Artist)
+    SELECT TrackId, Name, Composer, Album, Artist
+    FROM TrackSearchContent WHERE %(where)s;
+"""
+
+# remove documents from the index, an external-content index needs the
+# values it indexed: <select> yields (TrackId, Name, Composer, Album, Artist)
+_UNINDEX = """
+    INSERT INTO TrackSearch (TrackSearch, rowid, Name, Composer, Album, Artist)
+    %(select)s;
+"""
+
+# the indexed values of the track OLD, its album & artist being unchanged
+_OLD_TRACK = """
+    SELECT 'delete', OLD.TrackId, OLD.Name, OLD.Composer,
+           (SELECT Title FROM Album WHERE AlbumId = OLD.AlbumId),
+           (SELECT ar.Name FROM Album al JOIN Artist ar ON ar.ArtistId = al.ArtistId
+            WHERE al.AlbumId = OLD.AlbumId)
+"""
+
+# the indexed values of the tracks selected by <where>, as read from the
+# content view by BEFORE triggers, i.e. before the change
+_INDEXED = """
+    SELECT 'delete', TrackId, Name, Composer, Album, Artist
+    FROM TrackSearchContent WHERE %s
+"""
+
+# the tracks of the albums / of the albums of the artists with the ids <ids>
+_ALBUM_TRACKS = 'TrackId IN (SELECT TrackId FROM Track WHERE AlbumId IN (%s))'
+_ARTIST_TRACKS = 'TrackId IN (SELECT t.TrackId FROM Album al ' \
+                 'JOIN Track t ON t.AlbumId = al.AlbumId WHERE al.ArtistId IN (%s))'
+
+
+def _index(where):
+    return _INDEX % {'where': where}
+
+
+def _unindex(select):
+    return _UNINDEX % {'select': select}
+
+
+def _reindex_triggers(table, columns, tracks, key):
+    """
+    Returns the (name, body) of the triggers reindexing the <tracks> of the
+    <table> rows updated (<columns>) or deleted, before & after the change.
+    An updated <key> moves tracks between ids: the tracks of the old and
+    the new id are both reindexed.
+    """
+    updated = tracks % ('OLD.%s, NEW.%s' % (key, key))
+    deleted = tracks % ('OLD.%s' % key)
+    on_update = 'UPDATE OF %s ON %s' % (', '.join(columns), table)
+    return [
+        ('TrackSearch_%s_update' % table,
+         'BEFORE %s BEGIN %s END' % (on_update, _unindex(_INDEXED % updated))),
+        ('TrackSearch_%s_reindex' % table,
+         'AFTER %s BEGIN %s END' % (on_update, _index(updated))),
+        ('TrackSearch_%s_delete' % table,
+         'BEFORE DELETE ON %s BEGIN %s END' % (table, _unindex(_INDEXED % deleted))),
+        ('TrackSearch_%s_delete_reindex' % table,
+         'AFTER DELETE ON %s BEGIN %s END' % (table, _index(deleted))),
+    ]
+
+
+TRIGGERS = collections.OrderedDict([
+    ('TrackSearch_Track_insert',
+     'AFTER INSERT ON Track BEGIN %s END' % _index('TrackId = NEW.TrackId')),
+    ('TrackSearch_Track_delete',
+     'AFTER DELETE ON Track BEGIN %s END' % _unindex(_OLD_TRACK)),
+    ('TrackSearch_Track_update',
+     'AFTER UPDATE OF TrackId, Name, Composer, AlbumId ON Track BEGIN %s %s END' % (
+         _unindex(_OLD_TRACK), _index('TrackId = NEW.TrackId'))),
+])
+# album & artist changes unindex before the update / delete, while the
+# content view still shows what was indexed, and reindex after it
+TRIGGERS.update(_reindex_triggers('Album', ('AlbumId', 'Title', 'ArtistId'),
+                                  _ALBUM_TRACKS, 'AlbumId'))
+TRIGGERS.update(_reindex_triggers('Artist', ('ArtistId', 'Name'),
+                                  _ARTIST_TRACKS, 'ArtistId'))
+
+SEARCH = """
+SELECT t.TrackId, t.Name AS Track, t.Composer, al.AlbumId, al.Title AS Album,
+       ar.ArtistId, ar.Name AS Artist, bm25(TrackSearch, %(weights)s) AS Score
+FROM TrackSearch s
+JOIN Track t ON t.TrackId = s.rowid
+LEFT JOIN Album al ON al.AlbumId = t.AlbumId
+LEFT JOIN Artist ar ON ar.ArtistId = al.ArtistId
+WHERE TrackSearch MATCH :query
+ORDER BY Score, t.TrackId
+LIMIT :limit
+""" % {'weights': ', '.join('%s' % w for w in WEIGHTS)}
+
+SearchHit = collections.namedtuple(
+    'SearchHit', 'TrackId Track Composer AlbumId Album ArtistId Artist Score')
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def is_installed(conn):
+    """
+    Returns True when the TrackSearch index exists in the database of <conn>
+    """
+    return conn.dialect.has_table(conn, TABLE)
+
+
+def install(engine):
+    """
+    Creates the content view, the TrackSearch index & its triggers and
+    indexes every track
+    """
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_VIEW))
+        conn.execute(text(CREATE_TABLE))
+        for name, body in TRIGGERS.items():
+            conn.execute(text('CREATE TRIGGER IF NOT EXISTS %s %s' % (name, body)))
+        _rebuild(conn)
+
+
+def uninstall(engine):
+    """
+    Drops the triggers, the TrackSearch index and the content view
+    """
+    with engine.begin() as conn:
+        for name in TRIGGERS:
+            conn.execute(text('DROP TRIGGER IF EXISTS %s' % name))
+        conn.execute(text('DROP TABLE IF EXISTS %s' % TABLE))
+        conn.execute(text('DROP VIEW IF EXISTS %s' % CONTENT_VIEW))
+
+
+def _rebuild(conn):
+    conn.execute(text("INSERT INTO %s (%s) VALUES ('rebuild')" % (TABLE, TABLE)))
+
+
+def rebuild(engine):
+    """
+    Reindexes every track from the content view
+    """
+    with engine.begin() as conn:
+        _rebuild(conn)
+
+
+def verify(engine):
+    """
+    Returns None when the index matches the content view, otherwise the
+    error reported by the FTS5 integrity-check
+    """
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("INSERT INTO %s (%s, rank) VALUES ('integrity-check', 1)"
+                              % (TABLE, TABLE)))
+        except Exception as e:
+            return str(getattr(e, 'orig', e))
+    return None
+
+
+def match_expression(terms, prefix=True):
+    """
+    Returns the FTS5 query matching the documents holding every token of
+    <terms> (a string), as a prefix when <prefix> is True. Tokens are
+    quoted so FTS5 operators typed by users are taken literally.
+    """
+    tokens = _TOKEN.findall(terms)
+    return ' '.join('"%s"%s' % (token, '*' if prefix else '') for token in tokens)
+
+
+def search(session, terms, limit=LIMIT, prefix=True):
+    """
+    Returns the <limit> best SearchHits of the tracks whose name, composer,
+    album or artist match all tokens of <terms>, best first
+    """
+    query = match_expression(terms, prefix)
+    if not query:
+        return []
+    rows = session.execute(text(SEARCH), {'query': query, 'limit': limit})
+    return [SearchHit._make(row) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=['install', 'rebuild', 'verify', 'uninstall',
+                                            'search'])
+    parser.add_argument('terms', nargs='*')
+    parser.add_argument('--db', default='database.sqlite')
+    parser.add_argument('--limit', type=int, default=LIMIT)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite:///%s' % args.db)
+    if args.command == 'install':
+        install(engine)
+        print('> installed %s, %s & triggers in %s' % (TABLE, CONTENT_VIEW, args.db))
+    elif args.command == 'rebuild':
+        rebuild(engine)
+        print('> rebuilt %s' % TABLE)
+    elif args.command == 'uninstall':
+        uninstall(engine)
+        print('> removed %s, %s & triggers' % (TABLE, CONTENT_VIEW))
+    elif args.command == 'search':
+        with engine.connect() as conn:
+            for hit in search(conn, ' '.join(args.terms), args.limit):
+                print('%8.2f  %s - %s - %s' % (hit.Score, hit.Artist, hit.Album, hit.Track))
+    else:
+        error = verify(engine)
+        if error:
+            print(error)
+        print('> %s is %s' % (TABLE, 'out of date' if error else 'up to date'))
+        raise SystemExit(1 if error else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Materialized per-track sales rollup (Task 7).
+
+TrackSales holds, per track, the number of invoice lines that sold it
+(SoldCount, what Task 7 reports) and their revenue in integer cents. Once
+installed, triggers on InvoiceLine keep it current on every insert, update
+and delete, so artist / track / sales reports become a single indexed join.
+
+usage: python track_sales.py {install,rebuild,verify,uninstall} [--db PATH]
+"""
+import argparse
+
+from sqlalchemy import create_engine, text
+
+TABLE = 'TrackSales'
+
+# revenue of one invoice line, in cents
+LINE_CENTS = 'CAST(ROUND(%(row)s.UnitPrice * %(row)s.Quantity * 100) AS INTEGER)'
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS [TrackSales]
+(
+    [TrackId] INTEGER  NOT NULL,
+    [SoldCount] INTEGER  NOT NULL,
+    [RevenueCents] INTEGER  NOT NULL,
+    CONSTRAINT [PK_TrackSales] PRIMARY KEY  ([TrackId])
+)
+"""
+
+# add (sign=+1) or remove (sign=-1) the invoice line <row> (NEW / OLD)
+_APPLY_LINE = """
+    INSERT INTO TrackSales (TrackId, SoldCount, RevenueCents)
+    VALUES (%(row)s.TrackId, %(sign)s, %(sign)s * %(cents)s)
+    ON CONFLICT (TrackId) DO UPDATE
+    SET SoldCount = SoldCount + excluded.SoldCount,
+        RevenueCents = RevenueCents + excluded.RevenueCents;
+"""
+
+
+def _apply_line(row, sign):
+    return _APPLY_LINE % {'row': row, 'sign': sign,
+                          'cents': LINE_CENTS % {'row': row}}
+
+
+TRIGGERS = {
+    'TrackSales_InvoiceLine_insert':
+        'AFTER INSERT ON InvoiceLine BEGIN %s END' % _apply_line('NEW', 1),
+    'TrackSales_InvoiceLine_delete':
+        'AFTER DELETE ON InvoiceLine BEGIN %s END' % _apply_line('OLD', -1),
+    'TrackSales_InvoiceLine_update':
+        'AFTER UPDATE OF TrackId, UnitPrice, Quantity ON InvoiceLine BEGIN %s %s END' % (
+            _apply_line('OLD', -1), _apply_line('NEW', 1)),
+}
+
+# the full recomputation the rollup must always be equal to
+RECOMPUTE = """
+SELECT l.TrackId, COUNT(*) AS SoldCount, SUM(%s) AS RevenueCents
+FROM InvoiceLine l
+GROUP BY l.TrackId
+""" % (LINE_CENTS % {'row': 'l'})
+
+
+def is_installed(conn):
+    """
+    Returns True when the TrackSales rollup exists in the database of <conn>
+    """
+    return conn.dialect.has_table(conn, TABLE)
+
+
+def install(engine):
+    """
+    Creates the TrackSales table & its triggers and fills it
+    """
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_TABLE))
+        for name, body in TRIGGERS.items():
+            conn.execute(text('CREATE TRIGGER IF NOT EXISTS %s %s' % (name, body)))
+        _rebuild(conn)
+
+
+def uninstall(engine):
+    """
+    Drops the triggers and the TrackSales table
+    """
+    with engine.begin() as conn:
+        for name in TRIGGERS:
+            conn.execute(text('DROP TRIGGER IF EXISTS %s' % name))
+        conn.execute(text('DROP TABLE IF EXISTS %s' % TABLE))
+
+
+def _rebuild(conn):
+    conn.execute(text('DELETE FROM %s' % TABLE))
+    conn.execute(text('INSERT INTO %s (TrackId, SoldCount, RevenueCents) %s'
+                      % (TABLE, RECOMPUTE)))
+
+
+def rebuild(engine):
+    """
+    Recomputes the whole TrackSales table from InvoiceLine
+    """
+    with engine.begin() as conn:
+        _rebuild(conn)
+
+
+def verify(engine):
+    """
+    Compares TrackSales against a full recomputation and returns a list of
+    (TrackId, expected (count, cents), actual (count, cents)) mismatches.
+    Tracks that sold nothing may be missing or hold zeros.
+    """
+    with engine.connect() as conn:
+        expected = {row[0]: (row[1], row[2]) for row in conn.execute(text(RECOMPUTE))}
+        actual = {row[0]: (row[1], row[2]) for row in conn.execute(
+            text('SELECT TrackId, SoldCount, RevenueCents FROM %s' % TABLE))}
+    mismatches = []
+    for track_id in sorted(set(expected) | set(actual)):
+        want = expected.get(track_id, (0, 0))
+        have = actual.get(track_id, (0, 0))
+        if want != have:
+            mismatches.append((track_id, want, have))
+    return mismatches
+
+
+# one row per artist / album / track (NULLs for artists without albums or
+# tracks) with the track sales taken from %(sales)s, TrackSales or RECOMPUTE
+ARTIST_TRACK_SALES = """
+SELECT ar.ArtistId, ar.Name AS Artist, al.AlbumId, al.Title AS Album,
+       t.TrackId, t.Name AS Track, coalesce(s.SoldCount, 0) AS SoldCount,
+       coalesce(s.RevenueCents, 0) AS RevenueCents
+FROM Artist ar
+LEFT JOIN Album al ON al.ArtistId = ar.ArtistId
+LEFT JOIN Track t ON t.AlbumId = al.AlbumId
+LEFT JOIN %(sales)s s ON s.TrackId = t.TrackId
+ORDER BY ar.ArtistId, al.AlbumId, t.TrackId
+"""
+
+
+def sales_source(conn, use_rollup=None):
+    """
+    Returns the table (or subquery) holding the per track sales: TrackSales
+    when installed (or when <use_rollup> is True), otherwise RECOMPUTE
+    """
+    if use_rollup is None:
+        use_rollup = is_installed(conn)
+    return TABLE if use_rollup else '(%s)' % RECOMPUTE
+
+
+def artist_track_sales(session, use_rollup=None):
+    """
+    Returns a dict of artist name : {track name : number of sales} with one
+    query. TrackSales is used when installed (or when <use_rollup> is True),
+    otherwise the sales are aggregated from InvoiceLine in the same query.
+    Artists without albums / tracks are included with an empty dict.
+    """
+    query = ARTIST_TRACK_SALES % {
+        'sales': sales_source(session.connection(), use_rollup)}
+
+    artist_top_tracks = {}
+    for row in session.execute(text(query)):
+        tracks = artist_top_tracks.get(row.Artist)
+        if tracks is None:
+            tracks = artist_top_tracks[row.Artist] = {}
+        if row.Track is not None:
+            tracks[row.Track] = row.SoldCount
+    return artist_top_tracks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=['install', 'rebuild', 'verify', 'uninstall'])
+    parser.add_argument('--db', default='database.sqlite')
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite:///%s' % args.db)
+    if args.command == 'install':
+        install(engine)
+        print('> installed %s & triggers in %s' % (TABLE, args.db))
+    elif args.command == 'rebuild':
+        rebuild(engine)
+        print('> rebuilt %s' % TABLE)
+    elif args.command == 'uninstall':
+        uninstall(engine)
+        print('> removed %s & triggers' % TABLE)
+    else:
+        mismatches = verify(engine)
+        for track_id, want, have in mismatches:
+            print('TrackId %s: expected %s, found %s' % (track_id, want, have))
+        print('> %s is %s' % (TABLE, 'out of date' if mismatches else 'up to date'))
+        raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()